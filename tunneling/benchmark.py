@@ -0,0 +1,374 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from kde_curves import build_kde_curves
+from kde_features import KDE_FEATURES, compute_kde_features
+from pitch_angles import add_angle_columns
+from tunnel_helper_functions import create_tunneling_table
+from tunnel_pipeline import (
+    MODEL_FEATURES, PITCH_COLUMNS, TARGET, build_model_frame, prepare_pitches, score_tunnel_boost, update_run_values
+)
+from tunnel_store import STORE_COLUMNS, convert_csv_to_store
+
+# scales are fractions of one MLB regular season (~720k pitches from ~870 pitchers); a full season
+# (--scales 1) takes tens of minutes for the KDE and SHAP stages, so the default stops at a tenth
+SEASON_PITCHES = 720_000
+SEASON_PITCHERS = 870
+SCALES = [0.01, 0.1]
+BENCHMARK_YEAR = 2024
+BENCHMARK_FILE = 'benchmark_results.json'
+REPEAT = 3
+# a stage slower than this is timed once instead of REPEAT times
+MAX_REPEAT_SECONDS = 10.0
+RSS_SAMPLE_SECONDS = 0.005
+
+# pitch type -> (release_speed, vx0, vz0, ax, az, release_spin_rate), arm side positive for a right-hander
+PITCH_SHAPES = {
+    'FF': (94.0, 6.0, -4.0, -7.0, -15.0, 2300.0),
+    'SI': (93.0, 8.0, -5.0, -15.0, -22.0, 2150.0),
+    'FC': (89.0, 4.0, -3.0, 1.0, -25.0, 2400.0),
+    'SL': (85.0, 3.0, -1.0, 4.0, -30.0, 2450.0),
+    'CU': (79.0, 2.0, 2.0, 6.0, -40.0, 2600.0),
+    'CH': (85.0, 7.0, -3.0, -13.0, -27.0, 1750.0),
+}
+DESCRIPTIONS = ['ball', 'called_strike', 'swinging_strike', 'foul', 'hit_into_play']
+DESCRIPTION_WEIGHTS = [0.36, 0.16, 0.11, 0.18, 0.19]
+EVENTS = ['field_out', 'single', 'double', 'home_run']
+EVENT_WEIGHTS = [0.68, 0.21, 0.07, 0.04]
+
+
+def pitcher_workloads(scale, rng):
+    # a starter/reliever mix of season pitch counts, rescaled so the total is scale * SEASON_PITCHES
+    n_pitchers = max(1, round(SEASON_PITCHERS * scale))
+    is_starter = rng.random(n_pitchers) < 0.35
+    workloads = np.where(is_starter, rng.integers(1500, 3200, n_pitchers), rng.integers(150, 1100, n_pitchers))
+    return np.maximum(50, np.round(workloads * SEASON_PITCHES * scale / workloads.sum())).astype(int)
+
+
+def synthetic_pitches(scale, seed=0):
+    # Statcast-like raw pitches for scale seasons' worth of pitchers with three to five pitch types each
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i, n in enumerate(pitcher_workloads(scale, rng)):
+        arm = 1.0 if rng.random() < 0.7 else -1.0
+        arsenal = rng.choice(list(PITCH_SHAPES), size=rng.integers(3, 6), replace=False)
+        pitch_type = rng.choice(arsenal, size=n, p=rng.dirichlet(np.full(len(arsenal), 2.0)))
+        shape = np.array([PITCH_SHAPES[p] for p in pitch_type]) + rng.normal(0, [1.5, 0.8, 0.6, 2.0, 2.5, 80.0], (n, 6))
+        release_speed, vx0, vz0, ax, az, spin_rate = shape.T
+        description = rng.choice(DESCRIPTIONS, size=n, p=DESCRIPTION_WEIGHTS)
+
+        frames.append(pd.DataFrame({
+            'game_pk': i * 100_000 + np.arange(n) // 100,
+            'at_bat_number': np.arange(n) % 100 // 5,
+            'pitch_number': np.arange(n) % 5 + 1,
+            'game_date': f'{BENCHMARK_YEAR}-06-01',
+            'game_year': BENCHMARK_YEAR,
+            'pitcher': 600_000 + i,
+            'player_name': f'Pitcher{i:05d}, Synthetic',
+            'stand': rng.choice(['L', 'R'], size=n, p=[0.45, 0.55]),
+            'p_throws': 'R' if arm > 0 else 'L',
+            'pitch_type': pitch_type,
+            'release_speed': release_speed,
+            'release_pos_x': -arm * 2.0 + rng.normal(0, 0.15, n),
+            'release_pos_z': 5.9 + rng.normal(0, 0.15, n),
+            'release_extension': 6.4 + rng.normal(0, 0.2, n),
+            'release_spin_rate': spin_rate,
+            'spin_axis': rng.uniform(0, 360, n),
+            'vx0': arm * vx0,
+            'vy0': -1.47 * release_speed + rng.normal(0, 0.5, n),
+            'vz0': vz0,
+            'ax': arm * ax,
+            'ay': 27.0 + rng.normal(0, 2.0, n),
+            'az': az,
+            'plate_x': rng.normal(0, 0.8, n),
+            'plate_z': rng.normal(2.4, 0.8, n),
+            'balls': rng.integers(0, 4, n),
+            'strikes': rng.integers(0, 3, n),
+            'description': description,
+            'events': np.where(description == 'hit_into_play', rng.choice(EVENTS, size=n, p=EVENT_WEIGHTS), None),
+            'delta_run_exp': rng.normal(0, 0.12, n),
+        }))
+    return pd.concat(frames, ignore_index=True)[PITCH_COLUMNS]
+
+
+def synthetic_model_frame(pitches, seed=0):
+    # SHAP cost depends on the trees and row count, not on the KDE values, so those are drawn at random
+    rng = np.random.default_rng(seed)
+    df = prepare_pitches(pitches).reset_index(drop=True)
+    kde_values = pd.DataFrame(rng.gamma(2.0, 0.1, (len(df), len(KDE_FEATURES))), index=df.index,
+                              columns=[f'{feature}_KDE' for feature in KDE_FEATURES])
+    return build_model_frame(df.join(kde_values), update_run_values({}, df))
+
+
+def synthetic_booster(model_df, seed=0, num_boost_round=200, max_rows=50_000):
+    sample = model_df.dropna(subset=MODEL_FEATURES + [TARGET])
+    sample = sample.sample(min(len(sample), max_rows), random_state=seed)
+    params = {'objective': 'reg:squarederror', 'tree_method': 'hist', 'max_depth': 6, 'eta': 0.05, 'verbosity': 0}
+    booster = xgb.train(params, xgb.QuantileDMatrix(sample[MODEL_FEATURES], sample[TARGET]), num_boost_round)
+    booster.set_param({'nthread': 1})
+    return booster
+
+
+def synthetic_store_frame(pitches, seed=0):
+    # tunnel metrics on the scale of the published values, attached to prepared pitches
+    rng = np.random.default_rng(seed)
+    df = prepare_pitches(pitches).reset_index(drop=True)
+    for column in ['tunnel_boost', 'x_tunnel', 'y_tunnel', 'z_tunnel', 'shape_tunnel']:
+        df[column] = rng.normal(0, 0.01, len(df))
+    return df[STORE_COLUMNS]
+
+
+def current_rss():
+    # resident set size in bytes, from /proc on Linux; None where it is unavailable
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def max_rss():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def sample_peak_rss(run):
+    # runs once while a thread samples RSS, so native allocations (pyarrow, XGBoost) are counted too
+    start_rss = current_rss()
+    if start_rss is None:
+        start_max = max_rss()
+        run()
+        return None, max(0, max_rss() - start_max)
+
+    peak = [start_rss]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        run()
+    finally:
+        done.set()
+        sampler.join()
+    peak[0] = max(peak[0], current_rss())
+    return peak[0], peak[0] - start_rss
+
+
+def measure(run, repeat=REPEAT):
+    # the first, RSS-sampled run is cold; further runs only add timing samples
+    gc.collect()
+    start = time.perf_counter()
+    peak_rss, stage_rss = sample_peak_rss(run)
+    times = [time.perf_counter() - start]
+    while len(times) < repeat and times[0] < MAX_REPEAT_SECONDS:
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {
+        'seconds': min(times), 'mean_seconds': float(np.mean(times)), 'runs': len(times),
+        'peak_rss_mb': None if peak_rss is None else peak_rss / 2**20,
+        'stage_rss_mb': stage_rss / 2**20,
+        'max_rss_mb': max_rss() / 2**20,
+    }
+
+
+def app_setup(pitches, work_dir, seed):
+    from streamlit.logger import set_log_level
+
+    # the cached page functions run without a Streamlit runtime and warn on every call
+    set_log_level('error')
+    import streamlit as st
+    import streamlit_app as app
+
+    store_frame = synthetic_store_frame(pitches, seed)
+    csv_path = os.path.join(work_dir, 'tunnel_data.csv')
+    store_frame.to_csv(csv_path, index=False)
+    app.CACHE_DIR = os.path.join(work_dir, 'data_cache')
+    app.DATA_SOURCE = csv_path
+    app.REFRESH_SECONDS = 0
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    app.load_kde_curves()
+
+    # the busiest pitcher-season, the worst case for every per-page stage
+    player_name = store_frame.groupby('player_name', observed=True).size().idxmax()
+    season_df = store_frame[store_frame['player_name'] == player_name]
+    return app, store_frame, csv_path, player_name, season_df
+
+
+def cold(cached, *args, **kwargs):
+    cached.clear()
+    return cached(*args, **kwargs)
+
+
+def setup_angles(pitches, work_dir, n_jobs, seed):
+    return len(pitches), lambda: add_angle_columns(pitches)
+
+
+def setup_kde_features(pitches, work_dir, n_jobs, seed):
+    prepared = prepare_pitches(pitches).reset_index(drop=True)
+    return len(prepared), lambda: compute_kde_features(prepared, n_jobs=n_jobs)
+
+
+def setup_shap(pitches, work_dir, n_jobs, seed):
+    model_df = synthetic_model_frame(pitches, seed)
+    booster = synthetic_booster(model_df, seed)
+    return len(model_df), lambda: score_tunnel_boost(booster, model_df)
+
+
+def setup_store_convert(pitches, work_dir, n_jobs, seed):
+    store_frame = synthetic_store_frame(pitches, seed)
+    csv_path = os.path.join(work_dir, 'tunnel_data.csv')
+    store_frame.to_csv(csv_path, index=False)
+    return len(store_frame), lambda: convert_csv_to_store(csv_path, os.path.join(work_dir, 'tunnel_store'))
+
+
+def setup_load_data(pitches, work_dir, n_jobs, seed):
+    app, _, _, player_name, season_df = app_setup(pitches, work_dir, seed)
+    return len(season_df), lambda: cold(app.load_data, player_name, BENCHMARK_YEAR)
+
+
+def setup_create_tunneling_table(pitches, work_dir, n_jobs, seed):
+    season_df = synthetic_store_frame(pitches, seed)
+    season_df = season_df[season_df['pitcher'] == season_df['pitcher'].mode().iloc[0]]
+    return len(season_df), lambda: create_tunneling_table(season_df)
+
+
+def setup_kde_curves(pitches, work_dir, n_jobs, seed):
+    store_frame = synthetic_store_frame(pitches, seed)
+    return len(store_frame), lambda: build_kde_curves(store_frame)
+
+
+def setup_density_plot(pitches, work_dir, n_jobs, seed):
+    app, _, _, player_name, season_df = app_setup(pitches, work_dir, seed)
+    pitch = season_df['pitch_type'].mode().iloc[0]
+    return len(season_df), lambda: cold(app.density_plot, player_name, BENCHMARK_YEAR, pitch, 'All')
+
+
+def setup_tunnel_plot(pitches, work_dir, n_jobs, seed):
+    app, _, _, player_name, season_df = app_setup(pitches, work_dir, seed)
+
+    def run():
+        app.ellipse_summary.clear()
+        cold(app.tunnel_plot, player_name, BENCHMARK_YEAR, x_metric='HRA', y_metric='VRA',
+             x_label='Horizontal Release Angle', y_label='Vertical Release Angle')
+        plt.close('all')
+
+    return len(season_df), run
+
+
+STAGES = {
+    'angles': setup_angles,
+    'kde_features': setup_kde_features,
+    'shap': setup_shap,
+    'store_convert': setup_store_convert,
+    'load_data': setup_load_data,
+    'create_tunneling_table': setup_create_tunneling_table,
+    'kde_curves': setup_kde_curves,
+    'density_plot': setup_density_plot,
+    'tunnel_plot': setup_tunnel_plot,
+}
+
+
+def run_stage(stage, scale, repeat=REPEAT, n_jobs=1, seed=0):
+    pitches = synthetic_pitches(scale, seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        rows, run = STAGES[stage](pitches, work_dir, n_jobs, seed)
+        del pitches
+        return {'stage': stage, 'scale': scale, 'rows': rows, **measure(run, repeat)}
+
+
+def run_benchmarks(scales=SCALES, stages=None, repeat=REPEAT, n_jobs=1, seed=0):
+    # every stage runs in a fresh process, so its RSS and timings are not skewed by earlier stages
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for scale in scales:
+        for stage in stages or STAGES:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_stage, stage, scale, repeat, n_jobs, seed).result()
+            print(f"{stage:>24} {scale:>6g} season {result['rows']:>10,} rows {result['seconds']:>9.3f}s "
+                  f"{result['stage_rss_mb']:>9.1f} MB")
+            results.append(result)
+    return results
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+        'xgboost': xgb.__version__,
+    }
+
+
+def write_results(results, output_path, **settings):
+    with open(output_path, 'w') as f:
+        json.dump({'environment': environment_info(), 'settings': settings, 'results': results}, f, indent=2)
+
+
+def compare_results(baseline_path, current_path):
+    # ratio > 1 means the current run is slower or heavier than the baseline
+    frames = []
+    for path in [baseline_path, current_path]:
+        with open(path) as f:
+            frames.append(pd.DataFrame(json.load(f)['results']).set_index(['stage', 'scale'])[['seconds', 'stage_rss_mb']])
+    baseline, current = frames
+    return current.div(baseline).add_suffix('_ratio').join(current).dropna()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the tunneling app and pipeline on synthetic pitches.')
+    parser.add_argument('--output', default=BENCHMARK_FILE)
+    parser.add_argument('--scales', type=float, nargs='+', default=SCALES, help='fractions of one season')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, args.stages, args.repeat, args.jobs, args.seed)
+    write_results(results, args.output, scales=args.scales, repeat=args.repeat, jobs=args.jobs, seed=args.seed,
+                  season_pitches=SEASON_PITCHES, season_pitchers=SEASON_PITCHERS)
+    if args.baseline:
+        print(compare_results(args.baseline, args.output).round(3).to_string())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import gdown
+
+from tunnel_store import convert_csv_to_store
+
+try:
+    import fcntl
+except ImportError:  # file locking is best effort off POSIX
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = 'TUNNEL_CACHE_DIR'
+SOURCE_ENV = 'TUNNEL_DATA_SOURCE'
+REFRESH_ENV = 'TUNNEL_REFRESH_SECONDS'
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.lock'
+DOWNLOAD_FILE = 'download.tmp'
+SNAPSHOTS_DIR = 'snapshots'
+KEEP_SNAPSHOTS = 2
+REFRESH_INTERVAL = 60 * 60
+POLL_INTERVAL = 5 * 60
+CHECKSUM_BLOCK_SIZE = 1 << 20
+
+_refresh_threads = {}
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_path(cache_dir, version):
+    return os.path.join(cache_dir, SNAPSHOTS_DIR, version)
+
+
+def store_checksums(store_path):
+    checksums = {}
+    for root, _, files in os.walk(store_path):
+        for name in files:
+            path = os.path.join(root, name)
+            checksums[os.path.relpath(path, store_path)] = [os.path.getsize(path), file_checksum(path)]
+    return checksums
+
+
+def read_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'current': None, 'checked': 0, 'snapshots': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def cache_lock(cache_dir):
+    # one writer per cache directory across threads and processes; readers only use the manifest
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LOCK_FILE), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def fetch_source(source, output_path):
+    # a local path (or file:// URL) is copied, so tests can run without Google Drive
+    if source.startswith('file://') or '://' not in source:
+        shutil.copyfile(source[len('file://'):] if source.startswith('file://') else source, output_path)
+    elif gdown.download(source, output_path, quiet=True) is None:
+        raise RuntimeError(f"Could not download tunneling data from {source}")
+
+
+def validate_snapshot(cache_dir, version, manifest, full=False):
+    # sizes are checked on every start; full checksums only in the background verification
+    entry = manifest['snapshots'].get(version)
+    if entry is None:
+        return False
+    store_path = snapshot_path(cache_dir, version)
+    for name, (size, checksum) in entry['files'].items():
+        path = os.path.join(store_path, name)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            return False
+        if full and file_checksum(path) != checksum:
+            return False
+    return True
+
+
+def _snapshot_order(manifest):
+    # current snapshot first, then the rest newest first
+    others = sorted((v for v in manifest['snapshots'] if v != manifest['current']),
+                    key=lambda v: manifest['snapshots'][v]['created'], reverse=True)
+    return ([manifest['current']] if manifest['current'] in manifest['snapshots'] else []) + others
+
+
+def current_snapshot(cache_dir):
+    # path of the last good snapshot, or None if the cache holds nothing usable
+    manifest = read_manifest(cache_dir)
+    for version in _snapshot_order(manifest):
+        if validate_snapshot(cache_dir, version, manifest):
+            return snapshot_path(cache_dir, version)
+    return None
+
+
+def prune_snapshots(cache_dir, manifest, keep=KEEP_SNAPSHOTS):
+    for version in _snapshot_order(manifest)[keep:]:
+        shutil.rmtree(snapshot_path(cache_dir, version), ignore_errors=True)
+        del manifest['snapshots'][version]
+
+
+def add_snapshot(cache_dir, source):
+    # caller holds cache_lock; the snapshot is versioned by the source file's checksum
+    manifest = read_manifest(cache_dir)
+    download_path = os.path.join(cache_dir, DOWNLOAD_FILE)
+    try:
+        fetch_source(source, download_path)
+        checksum = file_checksum(download_path)
+        version = checksum[:16]
+        if not validate_snapshot(cache_dir, version, manifest):
+            store_path = snapshot_path(cache_dir, version)
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+            convert_csv_to_store(download_path, store_path)
+            manifest['snapshots'][version] = {
+                'sha256': checksum, 'source': source, 'created': time.time(), 'files': store_checksums(store_path)
+            }
+            logger.info("Added tunneling data snapshot %s from %s", version, source)
+    finally:
+        if os.path.exists(download_path):
+            os.remove(download_path)
+
+    manifest['current'] = version
+    manifest['checked'] = time.time()
+    prune_snapshots(cache_dir, manifest)
+    write_manifest(cache_dir, manifest)
+    return snapshot_path(cache_dir, version)
+
+
+def ensure_snapshot(cache_dir, source):
+    # serves the last good snapshot without touching the network; only an empty cache blocks on a download
+    store_path = current_snapshot(cache_dir)
+    if store_path is not None:
+        return store_path
+    with cache_lock(cache_dir):
+        # another process may have finished the download while this one waited for the lock
+        return current_snapshot(cache_dir) or add_snapshot(cache_dir, source)
+
+
+def refresh_snapshot(cache_dir, source, max_age=REFRESH_INTERVAL):
+    with cache_lock(cache_dir):
+        manifest = read_manifest(cache_dir)
+        if manifest['current'] is not None and time.time() - manifest['checked'] < max_age:
+            return snapshot_path(cache_dir, manifest['current'])
+        return add_snapshot(cache_dir, source)
+
+
+def verify_snapshots(cache_dir):
+    # drops snapshots whose files no longer match the manifest checksums
+    with cache_lock(cache_dir):
+        manifest = read_manifest(cache_dir)
+        corrupt = [v for v in manifest['snapshots'] if not validate_snapshot(cache_dir, v, manifest, full=True)]
+        for version in corrupt:
+            logger.warning("Removing corrupt tunneling data snapshot %s", version)
+            shutil.rmtree(snapshot_path(cache_dir, version), ignore_errors=True)
+            del manifest['snapshots'][version]
+        if corrupt:
+            remaining = _snapshot_order(manifest)
+            manifest['current'] = manifest['current'] if manifest['current'] in manifest['snapshots'] else \
+                (remaining[0] if remaining else None)
+            write_manifest(cache_dir, manifest)
+
+
+def _refresh_loop(cache_dir, source, on_update, max_age, poll_interval):
+    served = current_snapshot(cache_dir)
+    verified = False
+    while True:
+        try:
+            if not verified:
+                verify_snapshots(cache_dir)
+                verified = True
+            refresh_snapshot(cache_dir, source, max_age)
+        except Exception:
+            logger.exception("Refreshing tunneling data from %s failed; serving the last good snapshot", source)
+
+        # also picks up snapshots added by other processes sharing the cache directory
+        latest = current_snapshot(cache_dir)
+        if latest is not None and latest != served:
+            served = latest
+            if on_update is not None:
+                on_update(latest)
+        time.sleep(poll_interval)
+
+
+def start_background_refresh(cache_dir, source, on_update=None, max_age=REFRESH_INTERVAL, poll_interval=POLL_INTERVAL):
+    # at most one refresh thread per cache directory in a process
+    thread = _refresh_threads.get(cache_dir)
+    if thread is None or not thread.is_alive():
+        thread = threading.Thread(target=_refresh_loop, args=(cache_dir, source, on_update, max_age, poll_interval),
+                                  name='tunnel-data-refresh', daemon=True)
+        _refresh_threads[cache_dir] = thread
+        thread.start()
+    return thread
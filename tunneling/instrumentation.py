@@ -0,0 +1,171 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENT_ENV = 'TUNNEL_INSTRUMENT'
+PROFILE_ENV = 'TUNNEL_PROFILE'
+QUERY_PARAMS_ENV = 'TUNNEL_INSTRUMENT_QUERY_PARAMS'
+TIMINGS_LOG_ENV = 'TUNNEL_TIMINGS_LOG'
+INSTRUMENT_PARAM = 'instrument'
+PROFILE_PARAM = 'profile'
+TIMINGS_LOG = 'tunnel_timings.jsonl'
+PROFILES_DIR = 'profiles'
+PROFILERS = ['cprofile', 'pyinstrument']
+KEEP_PROFILES = 20
+
+_log_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+# reruns currently tracing, and whether tracemalloc was started here rather than by e.g. python -X tracemalloc
+_tracing = {'reruns': 0, 'started': False}
+
+
+def instrument_mode(value):
+    # '' or '0' disables; 'panel' also shows the sidebar breakdown; anything else only logs
+    value = (value or '').strip().lower()
+    if value in ('', '0', 'false', 'off'):
+        return None
+    return 'panel' if value == 'panel' else 'log'
+
+
+def profiler_name(value):
+    value = (value or '').strip().lower()
+    if value in ('', '0', 'false', 'off'):
+        return None
+    return value if value in PROFILERS else 'cprofile'
+
+
+def rerun_settings(params, environ=os.environ):
+    # any visitor can set query parameters, so they are ignored unless QUERY_PARAMS_ENV allows them;
+    # allowed parameters win over the environment, and a requested profile is logged like any instrumented rerun
+    if instrument_mode(environ.get(QUERY_PARAMS_ENV)) is None:
+        params = {}
+    mode = instrument_mode(params.get(INSTRUMENT_PARAM, environ.get(INSTRUMENT_ENV)))
+    profiler = profiler_name(params.get(PROFILE_PARAM, environ.get(PROFILE_ENV)))
+    return mode or ('log' if profiler else None), profiler
+
+
+def _start_profiler(name):
+    if name == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed; profiling this rerun with cProfile")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return 'pyinstrument', profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return 'cprofile', profiler
+
+
+def _stop_profiler(name, profiler, profiles_dir):
+    os.makedirs(profiles_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    if name == 'pyinstrument':
+        profiler.stop()
+        path = os.path.join(profiles_dir, f'rerun-{stamp}.html')
+        with open(path, 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = os.path.join(profiles_dir, f'rerun-{stamp}.prof')
+        profiler.dump_stats(path)
+    prune_profiles(profiles_dir)
+    return path
+
+
+def prune_profiles(profiles_dir, keep=KEEP_PROFILES):
+    # the timestamped names sort oldest first
+    profiles = sorted(name for name in os.listdir(profiles_dir) if name.startswith('rerun-'))
+    for name in profiles[:-keep]:
+        os.remove(os.path.join(profiles_dir, name))
+
+
+def _start_tracing():
+    with _tracing_lock:
+        if _tracing['reruns'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['started'] = True
+        _tracing['reruns'] += 1
+
+
+def _stop_tracing():
+    # tracing slows every allocation, so it stops with the last instrumented rerun
+    with _tracing_lock:
+        _tracing['reruns'] -= 1
+        if _tracing['reruns'] == 0 and _tracing['started']:
+            tracemalloc.stop()
+            _tracing['started'] = False
+
+
+def start_rerun(mode, profiler=None):
+    # spans cost one dict lookup when mode is None, so the calls can stay in place permanently
+    trace = {'mode': mode, 'spans': []}
+    if mode is None:
+        return trace
+    _start_tracing()
+    trace['tracing'] = True
+    trace['start'] = time.perf_counter()
+    trace['memory_start'] = tracemalloc.get_traced_memory()[0]
+    if profiler is not None:
+        try:
+            trace['profiler'] = _start_profiler(profiler)
+        except ValueError as error:  # Python 3.12+ allows one active profiler per process
+            logger.warning("Not profiling this rerun: %s", error)
+    return trace
+
+
+@contextmanager
+def span(trace, name):
+    # spans are flat: tracemalloc's peak is reset at each span start, so a nested span would hide its parent's peak
+    if trace['mode'] is None:
+        yield
+        return
+    memory_start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        memory_end, peak = tracemalloc.get_traced_memory()
+        trace['spans'].append({
+            'name': name,
+            'ms': elapsed * 1000,
+            'memory_delta_mb': (memory_end - memory_start) / 2**20,
+            'peak_mb': (peak - memory_start) / 2**20,
+        })
+
+
+def finish_rerun(trace, log_path=TIMINGS_LOG, profiles_dir=PROFILES_DIR, **context):
+    # one JSON line per rerun; memory is traced process-wide, so concurrent sessions show up in each other's deltas
+    if not trace.pop('tracing', False):
+        return None
+
+    try:
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            **context,
+            'total_ms': (time.perf_counter() - trace['start']) * 1000,
+            'memory_delta_mb': (tracemalloc.get_traced_memory()[0] - trace['memory_start']) / 2**20,
+            'peak_mb': max((s['peak_mb'] for s in trace['spans']), default=0.0),
+            'spans': trace['spans'],
+            'profile': None,
+        }
+        if 'profiler' in trace:
+            record['profile'] = _stop_profiler(*trace.pop('profiler'), profiles_dir)
+    finally:
+        _stop_tracing()
+
+    with _log_lock, open(log_path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+    return record
@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import gaussian_kde
+
+KDE_FEATURES = ['VRA', 'HRA', 'VAA', 'HAA']
+KDE_GROUP_KEYS = ['game_year', 'pitcher', 'stand']
+MIN_KDE_PITCHES = 5
+BINNED_GRID_SIZE = 1024
+
+
+def scott_bandwidth(std, n):
+    # gaussian_kde's default bandwidth
+    return std * n ** (-1 / 5)
+
+
+def linear_binning(values, lo, step, grid_size, rows=None, n_rows=1):
+    # counts on a regular grid, each value split between its two neighbouring grid points; values outside
+    # the grid land on its ends. rows assigns each value to one of n_rows independent count rows
+    position = np.clip((values - lo) / step, 0, grid_size - 1)
+    left = np.minimum(np.floor(position).astype(int), grid_size - 2)
+    weight = position - left
+    flat = left if rows is None else rows * grid_size + left
+    counts = np.bincount(flat, 1 - weight, n_rows * grid_size) + np.bincount(flat + 1, weight, n_rows * grid_size)
+    return counts.reshape(n_rows, grid_size)
+
+
+def smooth_binned_counts(counts, n, bandwidth, step):
+    # gaussian smoothing of binned counts with one bandwidth per row, using the kernel's analytic Fourier
+    # transform so every row is convolved in one batched FFT; zero padding to twice the grid avoids wrap-around
+    size = counts.shape[1]
+    freqs = np.fft.rfftfreq(2 * size, d=step)
+    transfer = np.exp(-0.5 * (2 * np.pi * freqs[None, :] * bandwidth[:, None]) ** 2)
+    density = np.fft.irfft(np.fft.rfft(counts, n=2 * size, axis=1) * transfer, n=2 * size, axis=1)[:, :size]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        density = np.clip(density, 0, None) / (n[:, None] * step)
+    density[(n < 2) | ~(bandwidth > 0)] = np.nan
+    return density
+
+
+def binned_kde(sample, points, grid_size=BINNED_GRID_SIZE):
+    # gaussian_kde approximated on a grid padded four bandwidths past the sample and the points
+    n = len(sample)
+    bandwidth = scott_bandwidth(np.std(sample, ddof=1), n)
+    lo = min(sample.min(), points.min()) - 4 * bandwidth
+    hi = max(sample.max(), points.max()) + 4 * bandwidth
+    grid, step = np.linspace(lo, hi, grid_size, retstep=True)
+
+    counts = linear_binning(sample, lo, step, grid_size)
+    density = smooth_binned_counts(counts, np.array([n]), np.array([bandwidth]), step)[0]
+    return np.interp(points, grid, density, left=0.0, right=0.0)
+
+
+def group_kde_features(pitch_types, values, binned_threshold=None):
+    # leave-one-pitch-type-out density of every pitch, evaluated once per (pitch type, feature)
+    results = np.full(values.shape, np.nan)
+    for pitch_type in pd.unique(pitch_types):
+        is_pitch = pitch_types == pitch_type
+        if len(pitch_types) - is_pitch.sum() < MIN_KDE_PITCHES:
+            continue
+        for j in range(values.shape[1]):
+            rest = values[~is_pitch, j]
+            points = values[is_pitch, j]
+            if binned_threshold is not None and len(rest) >= binned_threshold:
+                results[is_pitch, j] = binned_kde(rest, points)
+            else:
+                results[is_pitch, j] = gaussian_kde(rest)(points)
+    return results
+
+
+def _group_task(task):
+    positions, pitch_types, values, binned_threshold = task
+    return positions, group_kde_features(pitch_types, values, binned_threshold)
+
+
+def compute_kde_features(df, features=KDE_FEATURES, n_jobs=None, binned_threshold=None):
+    pitch_types = df['pitch_type'].to_numpy()
+    values = df[features].to_numpy(dtype=float)
+
+    tasks = [
+        (positions, pitch_types[positions], values[positions], binned_threshold)
+        for positions in df.groupby(KDE_GROUP_KEYS, sort=False, observed=True).indices.values()
+    ]
+
+    kde_values = np.full(values.shape, np.nan)
+    n_jobs = n_jobs or os.cpu_count()
+    if n_jobs == 1:
+        for positions, group_values in map(_group_task, tasks):
+            kde_values[positions] = group_values
+    else:
+        chunksize = max(1, len(tasks) // (n_jobs * 4))
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            for positions, group_values in executor.map(_group_task, tasks, chunksize=chunksize):
+                kde_values[positions] = group_values
+
+    return pd.DataFrame(kde_values, index=df.index, columns=[f'{feature}_KDE' for feature in features])
@@ -0,0 +1,82 @@
+import pandas as pd
+
+from tunnel_helper_functions import TUNNEL_METRICS, TUNNEL_SUM_COLUMNS, aggregate_tunneling
+
+CUBE_KEYS = ['pitcher', 'player_name', 'game_year', 'stand', 'pitch_type']
+PITCH_KEYS = ['pitcher', 'player_name', 'game_year', 'pitch_type']
+LEADERBOARD_MIN_PITCHES = 50
+PLATOON_MIN_PITCHES = 100
+LEADERBOARD_ROWS = 25
+
+METRIC_LABELS = {
+    'tunnel_boost': 'Tunnel Boost', 'x_tunnel': 'X Tunnel', 'y_tunnel': 'Y Tunnel',
+    'z_tunnel': 'Z Tunnel', 'shape_tunnel': 'Shape Tunnel'
+}
+
+
+def build_tunnel_cube(data):
+    # counts and sums only, so any mean, usage rate or split can be rebuilt without the raw pitches
+    cube = aggregate_tunneling(data, keys=['pitcher', 'player_name', 'game_year'])
+    cube = cube[CUBE_KEYS + ['total_n'] + TUNNEL_SUM_COLUMNS].astype({'stand': 'category'})
+    return cube.sort_values(['game_year', 'stand', 'pitcher', 'pitch_type'], kind='stable').reset_index(drop=True)
+
+
+def cube_slice(cube, game_year=None, stand='All', min_n=0, pitch_types=None):
+    mask = (cube['stand'] == stand).to_numpy() & (cube['n'] >= min_n).to_numpy()
+    if game_year is not None:
+        mask &= (cube['game_year'] == game_year).to_numpy()
+    if pitch_types:
+        mask &= cube['pitch_type'].isin(pitch_types).to_numpy()
+    return cube[mask]
+
+
+def cube_means(rows, metrics=TUNNEL_METRICS):
+    columns = {key: rows[key] for key in PITCH_KEYS + ['stand', 'n']}
+    columns['Usage%'] = rows['n'] / rows['total_n'] * 100
+    for metric in metrics:
+        columns[metric] = rows[f'{metric}_sum'] / rows[f'{metric}_count']
+    return pd.DataFrame(columns)
+
+
+def tunnel_leaderboard(cube, game_year=None, stand='All', metric='tunnel_boost', min_n=LEADERBOARD_MIN_PITCHES,
+                       pitch_types=None, ascending=False, limit=None):
+    # every pitcher's pitch types ranked by one metric, filtered before any means are taken
+    leaderboard = cube_means(cube_slice(cube, game_year, stand, min_n, pitch_types))
+    leaderboard = leaderboard.dropna(subset=[metric]).sort_values(metric, ascending=ascending, kind='stable')
+    return (leaderboard if limit is None else leaderboard.head(limit)).reset_index(drop=True)
+
+
+def platoon_splits(cube, game_year=None, metric='tunnel_boost', min_n=PLATOON_MIN_PITCHES, pitch_types=None,
+                   ascending=True, limit=None):
+    # metric against right-handed hitters minus left-handed hitters for pitch types with min_n on both sides
+    right, left = [
+        cube_means(cube_slice(cube, game_year, stand, min_n, pitch_types), [metric])[PITCH_KEYS + ['n', metric]]
+        for stand in ['R', 'L']
+    ]
+    splits = right.merge(left, on=PITCH_KEYS, suffixes=('_R', '_L'))
+    splits[f'{metric}_diff'] = splits[f'{metric}_R'] - splits[f'{metric}_L']
+    splits = splits.dropna(subset=[f'{metric}_diff']).sort_values(f'{metric}_diff', ascending=ascending, kind='stable')
+    return (splits if limit is None else splits.head(limit)).reset_index(drop=True)
+
+
+def display_names(player_names):
+    # "Last, First" -> "First Last", as in the page titles
+    return player_names.astype(str).str.split(', ').str[::-1].str.join(' ')
+
+
+def format_leaderboard(leaderboard):
+    table = leaderboard[['player_name', 'pitch_type', 'n', 'Usage%'] + TUNNEL_METRICS].rename(columns={
+        'player_name': 'Pitcher', 'pitch_type': 'Pitch Type', 'n': 'Pitches', **METRIC_LABELS
+    })
+    table['Pitcher'] = display_names(table['Pitcher'])
+    table['Pitch Type'] = table['Pitch Type'].astype(str)
+    return table.round({'Usage%': 1, **{label: 2 for label in METRIC_LABELS.values()}})
+
+
+def format_platoon_splits(splits, metric):
+    label = METRIC_LABELS[metric]
+    table = splits[['player_name', 'pitch_type', 'n_R', 'n_L', f'{metric}_R', f'{metric}_L', f'{metric}_diff']]
+    table.columns = ['Pitcher', 'Pitch Type', 'Pitches vs. RHH', 'Pitches vs. LHH',
+                     f'{label} vs. RHH', f'{label} vs. LHH', 'Difference (RHH - LHH)']
+    table = table.assign(Pitcher=display_names(table['Pitcher']), **{'Pitch Type': table['Pitch Type'].astype(str)})
+    return table.round(2)
@@ -0,0 +1,49 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+ANGLE_INPUTS = ['vx0', 'vy0', 'vz0', 'ax', 'ay', 'az', 'release_extension']
+ANGLE_OUTPUTS = ['VRA', 'HRA', 'VAA', 'HAA', 't', 'vy_f']
+CHUNK_SIZE = 500_000
+
+# approach angles are measured at the front of home plate
+PLATE_Y = 17 / 12
+
+
+def calculate_angles(vx0, vy0, vz0, ax, ay, az, release_extension):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vy_s = -np.sqrt(vy0**2 - 2 * ay * (60.5 - release_extension - 50))
+        t_s = (vy_s - vy0) / ay
+        VRA = -np.arctan((vz0 - az * t_s) / vy_s) * (180 / np.pi)
+        HRA = -np.arctan((vx0 - ax * t_s) / vy_s) * (180 / np.pi)
+
+        vy_f = -np.sqrt(vy0**2 - 2 * ay * (50 - PLATE_Y))
+        t = (vy_f - vy0) / ay
+        vz_f = vz0 + az * t
+        vx_f = vx0 + ax * t
+        VAA = -(180 + np.degrees(np.arctan2(vz_f, vy_f)))
+        HAA = -np.arctan(vx_f / vy_f) * (180 / np.pi)
+
+    return {'VRA': VRA, 'HRA': HRA, 'VAA': VAA, 'HAA': HAA, 't': t, 'vy_f': vy_f}
+
+
+def add_angle_columns(df):
+    inputs = {column: df[column].to_numpy(dtype=float) for column in ANGLE_INPUTS}
+    return df.assign(**calculate_angles(**inputs))
+
+
+def iter_angle_chunks(csv_path, chunksize=CHUNK_SIZE, min_year=None, **read_csv_kwargs):
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, **read_csv_kwargs):
+        if min_year is not None:
+            chunk = chunk[chunk['game_year'] >= min_year]
+        yield add_angle_columns(chunk)
+
+
+def write_angles_csv(csv_path, output_path, chunksize=CHUNK_SIZE, min_year=None):
+    for i, chunk in enumerate(iter_angle_chunks(csv_path, chunksize, min_year, low_memory=False)):
+        chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+if __name__ == '__main__':
+    write_angles_csv(sys.argv[1], sys.argv[2])
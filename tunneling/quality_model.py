@@ -0,0 +1,103 @@
+import logging
+import os
+import sys
+
+import numpy as np
+import optuna
+import xgboost as xgb
+from sklearn.model_selection import KFold
+
+from tunnel_pipeline import MODEL_FEATURES, TARGET, read_state_years
+
+logger = logging.getLogger(__name__)
+
+N_TRIALS = 50
+N_FOLDS = 5
+EARLY_STOPPING_ROUNDS = 50
+STUDY_NAME = 'quality_model'
+
+
+def build_cv_folds(X, y, n_folds=N_FOLDS):
+    # quantized once and shared by every trial; validation sets reuse the training cuts
+    folds = []
+    for train_idx, valid_idx in KFold(n_splits=n_folds, shuffle=True, random_state=13).split(X):
+        dtrain = xgb.QuantileDMatrix(X.iloc[train_idx], y.iloc[train_idx])
+        dvalid = xgb.QuantileDMatrix(X.iloc[valid_idx], y.iloc[valid_idx], ref=dtrain)
+        folds.append((dtrain, dvalid))
+    return folds
+
+
+def suggest_params(trial, nthread):
+    return {
+        "verbosity": 0,
+        "objective": "reg:squarederror",
+        "eval_metric": "rmse",
+        "tree_method": "hist",
+        "nthread": nthread,
+        "lambda": trial.suggest_float("lambda", 1e-8, 1.0, log=True),
+        "alpha": trial.suggest_float("alpha", 1e-8, 1.0, log=True),
+        "max_depth": trial.suggest_int("max_depth", 3, 9),
+        "eta": trial.suggest_float("eta", 0.01, 0.3, log=True),
+        "gamma": trial.suggest_float("gamma", 1e-8, 1.0, log=True),
+        "grow_policy": trial.suggest_categorical("grow_policy", ["depthwise", "lossguide"]),
+        "subsample": trial.suggest_float("subsample", 0.5, 1.0),
+        "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
+        "min_child_weight": trial.suggest_int("min_child_weight", 1, 10),
+    }
+
+
+def objective(trial, folds, nthread):
+    params = suggest_params(trial, nthread)
+    num_boost_round = trial.suggest_int("n_estimators", 100, 1000)
+
+    rmse_scores, best_rounds = [], []
+    for fold, (dtrain, dvalid) in enumerate(folds):
+        booster = xgb.train(params, dtrain, num_boost_round, evals=[(dvalid, 'valid')],
+                            early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+        rmse_scores.append(booster.best_score)
+        best_rounds.append(booster.best_iteration + 1)
+
+        trial.report(np.mean(rmse_scores), fold)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+
+    trial.set_user_attr("best_rounds", int(np.mean(best_rounds)))
+    return np.mean(rmse_scores)
+
+
+def tune_quality_model(X, y, storage, n_trials=N_TRIALS, n_parallel=None):
+    study = optuna.create_study(
+        study_name=STUDY_NAME, storage=storage, load_if_exists=True, direction="minimize",
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1)
+    )
+
+    finished = [t for t in study.trials if t.state in (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)]
+    remaining = n_trials - len(finished)
+    if remaining > 0:
+        n_parallel = n_parallel or max(1, os.cpu_count() // 4)
+        nthread = max(1, os.cpu_count() // n_parallel)
+        folds = build_cv_folds(X, y)
+        study.optimize(lambda trial: objective(trial, folds, nthread), n_trials=remaining, n_jobs=n_parallel)
+
+    return study
+
+
+def train_quality_model(model_df, model_path, storage, n_trials=N_TRIALS, n_parallel=None):
+    model_df = model_df.dropna(subset=MODEL_FEATURES + [TARGET])
+    X = model_df[MODEL_FEATURES]
+    y = model_df[TARGET]
+
+    study = tune_quality_model(X, y, storage, n_trials, n_parallel)
+    logger.info("Best hyperparameters: %s", study.best_params)
+
+    best_trial = study.best_trial
+    params = suggest_params(best_trial, os.cpu_count())
+    booster = xgb.train(params, xgb.QuantileDMatrix(X, y), best_trial.user_attrs["best_rounds"])
+    booster.save_model(model_path)
+    return booster
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    state_path, model_path, storage = sys.argv[1:4]
+    train_quality_model(read_state_years(state_path), model_path, storage)
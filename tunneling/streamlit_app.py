@@ -1,20 +1,176 @@
+import io
+import os
 import streamlit as st
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
-import gdown
-from tunnel_helper_functions import create_tunneling_table, plot_pitcher_metrics
+from streamlit.logger import get_logger
+from data_cache import (
+    CACHE_DIR_ENV, REFRESH_ENV, REFRESH_INTERVAL, SOURCE_ENV, ensure_snapshot, start_background_refresh
+)
+from instrumentation import (
+    PROFILE_PARAM, TIMINGS_LOG, TIMINGS_LOG_ENV, finish_rerun, rerun_settings, span, start_rerun
+)
+from kde_curves import curve_support
+from kde_features import KDE_FEATURES
+from leaderboard import (
+    LEADERBOARD_MIN_PITCHES, LEADERBOARD_ROWS, METRIC_LABELS, PLATOON_MIN_PITCHES, format_leaderboard,
+    format_platoon_splits, platoon_splits, tunnel_leaderboard
+)
+from tunnel_helper_functions import render_tunneling_table, plot_pitcher_metrics, summarize_pitcher_metrics
+from tunnel_store import (
+    memory_report, read_store_index, read_tunneling_summary, read_tunnel_cube, read_kde_curves, read_pitcher_season
+)
 
 st.set_page_config(layout="wide")
 
-@st.cache_data
-def load_data():
-    url = "https://drive.google.com/uc?id=1U8wPV1QrhVTv0uebehMMFKHQTROFaXs1"
-    output = "tunnel_data.csv"
-    gdown.download(url, output, quiet=False)
-    return pd.read_csv(output)
-
-def main():
+logger = get_logger(__name__)
+
+DATA_URL = "https://drive.google.com/uc?id=1U8wPV1QrhVTv0uebehMMFKHQTROFaXs1"
+CACHE_DIR = os.environ.get(CACHE_DIR_ENV, "data_cache")
+DATA_SOURCE = os.environ.get(SOURCE_ENV, DATA_URL)
+# seconds between checks for a newer data file; 0 serves the cached snapshot without refreshing
+REFRESH_SECONDS = int(os.environ.get(REFRESH_ENV, REFRESH_INTERVAL))
+TIMINGS_LOG_PATH = os.environ.get(TIMINGS_LOG_ENV, TIMINGS_LOG)
+TABLE_CACHE_ENTRIES = 1024
+FIGURE_CACHE_ENTRIES = 256
+# pitcher-season frames; a worker holds only the recently viewed ones, never the whole table
+SEASON_CACHE_ENTRIES = 64
+
+# the only raw pitch columns the tabs read; tunnel metrics come from the precomputed summary
+PITCH_COLUMNS = ['pitch_type', 'stand', 'VRA', 'HRA', 'VAA', 'HAA']
+
+ANGLE_TITLES = {
+    'VRA': 'Vertical Release Angle', 'HRA': 'Horizontal Release Angle',
+    'VAA': 'Vertical Approach Angle', 'HAA': 'Horizontal Approach Angle'
+}
+
+def on_snapshot_update(store_path):
+    # runs on the refresh thread; the next rerun reloads everything from the new snapshot
+    logger.info("Switching to tunneling data snapshot %s", store_path)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+@st.cache_resource
+def load_snapshot_path():
+    store_path = ensure_snapshot(CACHE_DIR, DATA_SOURCE)
+    if REFRESH_SECONDS:
+        start_background_refresh(CACHE_DIR, DATA_SOURCE, on_update=on_snapshot_update, max_age=REFRESH_SECONDS)
+    return store_path
+
+def load_store_path():
+    # another process sharing the cache may prune the snapshot this one serves, e.g. when refreshing is
+    # disabled here; every cache is then rebuilt from the current snapshot
+    store_path = load_snapshot_path()
+    if not os.path.isdir(store_path):
+        logger.warning("Tunneling data snapshot %s was removed; switching to the current snapshot", store_path)
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        store_path = load_snapshot_path()
+    return store_path
+
+@st.cache_resource
+def load_store():
+    return read_store_index(load_store_path())
+
+@st.cache_resource
+def load_tunneling_summary():
+    summary = read_tunneling_summary(load_store_path())
+    logger.info("Tunneling summary memory per column (MB):\n%s", memory_report(summary).round(2).to_string())
+    return summary
+
+@st.cache_resource
+def load_tunnel_cube():
+    cube = read_tunnel_cube(load_store_path())
+    logger.info("Tunnel cube memory per column (MB):\n%s", memory_report(cube).round(2).to_string())
+    return cube
+
+@st.cache_data(max_entries=TABLE_CACHE_ENTRIES)
+def tunneling_table(player_name, game_year, stand):
+    summary = load_tunneling_summary()
+    key = (player_name, game_year, stand)
+    rows = summary.loc[[key]] if key in summary.index else summary.iloc[:0]
+    return render_tunneling_table(rows)
+
+@st.cache_data(max_entries=SEASON_CACHE_ENTRIES)
+def load_data(player_name, game_year):
+    data = read_pitcher_season(load_store_path(), load_store(), player_name, game_year, columns=PITCH_COLUMNS)
+    logger.info("Loaded %s %s: %d pitches, %.2f MB", player_name, game_year, len(data), memory_report(data)['MB'].sum())
+    return data
+
+@st.cache_resource
+def load_kde_curves():
+    curve_index, grids, curves = read_kde_curves(load_store_path())
+    # the curves are memory-mapped, so only the pages of viewed pitchers become resident
+    logger.info("KDE curves: %d curves, grids %.2f MB in memory, curves %.2f MB memory-mapped",
+                len(curve_index), grids.nbytes / 2**20, curves.nbytes / 2**20)
+    return curve_index, grids, curves
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES)
+def density_plot(player_name, game_year, pitch, stand):
+    curve_index, grids, curves = load_kde_curves()
+    row = curve_index.get((player_name, game_year, stand, pitch))
+
+    fig, axes = plt.subplots(2, 2, figsize=(16, 8), sharey=True)
+
+    plt.subplots_adjust(wspace=0.2, hspace=0.5)
+
+    tick_size = 12
+
+    for j, (feature, ax) in enumerate(zip(KDE_FEATURES, axes.flat)):
+        if row is not None:
+            for density, color, label in zip(curves[row, j], ['blue', 'red'], [pitch, "Rest of Arsenal"]):
+                support = curve_support(density)
+                if support.stop > support.start:
+                    line, = ax.plot(grids[j][support], density[support], color=color, label=label, lw=2)
+                    line.sticky_edges.y[:] = [0, np.inf]
+        ax.set_title(ANGLE_TITLES[feature], fontsize=18)
+        ax.set_xlabel('')
+        ax.tick_params(axis='both', labelsize=tick_size)
+
+    for ax in axes[:, 0]:
+        ax.set_ylabel('Density', fontsize=16)
+
+    handles, labels = axes[0, 0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='lower center', ncol=2, fontsize=16, frameon=False)
+
+    return figure_png(fig)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES)
+def ellipse_summary(player_name, game_year):
+    return summarize_pitcher_metrics(load_data(player_name, game_year))
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES)
+def tunnel_plot(player_name, game_year, x_metric, y_metric, x_label, y_label):
+    fig, axs = plt.subplots(1, 2, figsize=(16, 8), sharey=True, sharex=True)
+    plt.subplots_adjust(wspace=0.1)
+    plot_pitcher_metrics(
+        player_name, load_data(player_name, game_year), fig, axs,
+        x_metric=x_metric, y_metric=y_metric,
+        x_label=x_label,
+        y_label=y_label,
+        summary=ellipse_summary(player_name, game_year)
+    )
+    return figure_png(fig)
+
+def figure_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+def show_timing_panel(record):
+    with st.sidebar.expander("Rerun Timings", expanded=True):
+        st.markdown(f"**Total:** {record['total_ms']:.1f} ms  \n**Memory:** {record['memory_delta_mb']:+.2f} MB "
+                    f"(peak {record['peak_mb']:.2f} MB)")
+        spans = pd.DataFrame(record['spans'], columns=['name', 'ms', 'memory_delta_mb', 'peak_mb'])
+        spans.columns = ['Stage', 'ms', 'Memory MB', 'Peak MB']
+        st.dataframe(spans.round(2), hide_index=True)
+        if record['profile'] is not None:
+            with open(record['profile'], 'rb') as f:
+                st.download_button("Download Profile", f.read(), file_name=os.path.basename(record['profile']))
+
+def render_page(trace, context):
     st.markdown("""
         <div style="text-align: left;">
             <h1>Pitch Tunneling</h1>
@@ -26,7 +182,8 @@ def main():
             </h4>
         </div>
     """, unsafe_allow_html=True)
-    data = load_data()
+    with span(trace, 'load_store'):
+        store_index = load_store()
 
     st.markdown("""
         <style>
@@ -44,7 +201,7 @@ def main():
         st.session_state.selected_player = default_player
 
     st.sidebar.markdown('<div class="centered-title">Select Player</div>', unsafe_allow_html=True)
-    player_names = sorted(data['player_name'].unique())
+    player_names = store_index['players']
     selected_player = st.sidebar.selectbox(
         "", 
         player_names, 
@@ -54,16 +211,16 @@ def main():
 
     first_last_name = " ".join(selected_player.split(", ")[::-1])
 
-    player_df = data[data['player_name'] == selected_player]
-
     st.sidebar.markdown('<div class="centered-title">Select Game Year</div>', unsafe_allow_html=True)
-    available_years = sorted(player_df['game_year'].unique(), reverse=True)
+    available_years = store_index['years'][selected_player]
     selected_year = st.sidebar.selectbox("", available_years)
+    context.update(player_name=selected_player, game_year=selected_year)
 
-    player_df = player_df[player_df['game_year'] == selected_year]
+    with span(trace, 'load_data'):
+        player_df = load_data(selected_player, selected_year)
 
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Tunneling Metrics", "Kernel Density Plots", "Tunnel Ellipses Plots", 
-                                      "Research & Methodology", "About Me"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Tunneling Metrics", "Kernel Density Plots", "Tunnel Ellipses Plots",
+                                            "Leaderboard", "Research & Methodology", "About Me"])
 
     with tab1:
         st.markdown(f"""
@@ -79,9 +236,7 @@ def main():
             </div>
         """, unsafe_allow_html=True)
 
-        filtered_df = player_df[player_df['player_name'] == selected_player]
-
-        if filtered_df.empty:
+        if player_df.empty:
             st.warning(f"No data available for {selected_player} in {selected_year}.")
         else:
             st.markdown("""
@@ -97,15 +252,18 @@ def main():
             """, unsafe_allow_html=True)
 
             st.markdown('<div class="center-content"><h4>All Hitters</h4></div>', unsafe_allow_html=True)
-            full_html = create_tunneling_table(filtered_df)
+            with span(trace, 'tunneling_table_All'):
+                full_html = tunneling_table(selected_player, selected_year, 'All')
             st.markdown(f'<div class="center-table">{full_html}</div>', unsafe_allow_html=True)
 
             st.markdown('<div class="center-content"><h4>Left-Handed Hitters</h4></div>', unsafe_allow_html=True)
-            left_html = create_tunneling_table(filtered_df[filtered_df['stand'] == 'L'])
+            with span(trace, 'tunneling_table_L'):
+                left_html = tunneling_table(selected_player, selected_year, 'L')
             st.markdown(f'<div class="center-table">{left_html}</div>', unsafe_allow_html=True)
 
             st.markdown('<div class="center-content"><h4>Right-Handed Hitters</h4></div>', unsafe_allow_html=True)
-            right_html = create_tunneling_table(filtered_df[filtered_df['stand'] == 'R'])
+            with span(trace, 'tunneling_table_R'):
+                right_html = tunneling_table(selected_player, selected_year, 'R')
             st.markdown(f'<div class="center-table">{right_html}</div>', unsafe_allow_html=True)
 
             st.markdown("""
@@ -172,49 +330,8 @@ def main():
             <h3 style="text-align: center;">{pitch} Release and Approach Angle KDEs vs. Rest of Arsenal</h3>
         """, unsafe_allow_html=True)
 
-        if stand != 'All':
-            subset_df = player_df[player_df['stand'] == stand]
-        else:
-            subset_df = player_df.copy()
-
-        subset_df = subset_df.dropna(subset=['VRA', 'HRA', 'VAA', 'HAA'])
-
-        fig, axes = plt.subplots(2, 2, figsize=(16, 8), sharey=True)
-
-        plt.subplots_adjust(wspace=0.2, hspace=0.5)
-
-        tick_size = 12
-
-        sns.kdeplot(subset_df[subset_df['pitch_type'] == pitch]['VRA'], color='blue', label=pitch, lw=2, ax=axes[0, 0])
-        sns.kdeplot(subset_df[subset_df['pitch_type'] != pitch]['VRA'], color='red', label="Rest of Arsenal", lw=2, ax=axes[0, 0])
-        axes[0, 0].set_title('Vertical Release Angle', fontsize=18)
-        axes[0, 0].set_xlabel('')
-        axes[0, 0].set_ylabel('Density', fontsize=16)
-        axes[0, 0].tick_params(axis='both', labelsize=tick_size)
-
-        sns.kdeplot(subset_df[subset_df['pitch_type'] == pitch]['HRA'], color='blue', label=pitch, lw=2, ax=axes[0, 1])
-        sns.kdeplot(subset_df[subset_df['pitch_type'] != pitch]['HRA'], color='red', label="Rest of Arsenal", lw=2, ax=axes[0, 1])
-        axes[0, 1].set_title('Horizontal Release Angle', fontsize=18)
-        axes[0, 1].set_xlabel('')
-        axes[0, 1].tick_params(axis='both', labelsize=tick_size)
-
-        sns.kdeplot(subset_df[subset_df['pitch_type'] == pitch]['VAA'], color='blue', label=pitch, lw=2, ax=axes[1, 0])
-        sns.kdeplot(subset_df[subset_df['pitch_type'] != pitch]['VAA'], color='red', label="Rest of Arsenal", lw=2, ax=axes[1, 0])
-        axes[1, 0].set_title('Vertical Approach Angle', fontsize=18)
-        axes[1, 0].set_xlabel('')
-        axes[1, 0].set_ylabel('Density', fontsize=16)
-        axes[1, 0].tick_params(axis='both', labelsize=tick_size)
-
-        sns.kdeplot(subset_df[subset_df['pitch_type'] == pitch]['HAA'], color='blue', label=pitch, lw=2, ax=axes[1, 1])
-        sns.kdeplot(subset_df[subset_df['pitch_type'] != pitch]['HAA'], color='red', label="Rest of Arsenal", lw=2, ax=axes[1, 1])
-        axes[1, 1].set_title('Horizontal Approach Angle', fontsize=18)
-        axes[1, 1].set_xlabel('')
-        axes[1, 1].tick_params(axis='both', labelsize=tick_size)
-
-        handles, labels = axes[0, 0].get_legend_handles_labels()
-        fig.legend(handles, labels, loc='lower center', ncol=2, fontsize=16, frameon=False)
-
-        st.pyplot(fig)
+        with span(trace, 'density_plot'):
+            st.image(density_plot(selected_player, selected_year, pitch, stand))
 
     with tab3:
         st.markdown(f"""
@@ -232,30 +349,90 @@ def main():
         st.markdown("""
             <h3 style="text-align: center;">Tunnels at Release (1 StDev Ellipses)</h3>
         """, unsafe_allow_html=True)
-        fig1, axs1 = plt.subplots(1, 2, figsize=(16, 8), sharey=True, sharex=True)
-        plt.subplots_adjust(wspace=0.1)
-        plot_pitcher_metrics(
-            selected_player, player_df, fig1, axs1,
-            x_metric='HRA', y_metric='VRA',
-            x_label='Horizontal Release Angle',
-            y_label='Vertical Release Angle'
-        )
-        st.pyplot(fig1)
+        with span(trace, 'tunnel_plot_release'):
+            st.image(tunnel_plot(
+                selected_player, selected_year,
+                x_metric='HRA', y_metric='VRA',
+                x_label='Horizontal Release Angle',
+                y_label='Vertical Release Angle'
+            ))
 
         st.markdown("""
             <h3 style="text-align: center;">Tunnels at Home Plate (1 StDev Ellipses)</h3>
         """, unsafe_allow_html=True)
-        fig2, axs2 = plt.subplots(1, 2, figsize=(16, 8), sharey=True, sharex=True)
-        plt.subplots_adjust(wspace=0.1)
-        plot_pitcher_metrics(
-            selected_player, player_df, fig2, axs2,
-            x_metric='HAA', y_metric='VAA',
-            x_label='Horizontal Approach Angle',
-            y_label='Vertical Approach Angle',
-        )
-        st.pyplot(fig2)
+        with span(trace, 'tunnel_plot_plate'):
+            st.image(tunnel_plot(
+                selected_player, selected_year,
+                x_metric='HAA', y_metric='VAA',
+                x_label='Horizontal Approach Angle',
+                y_label='Vertical Approach Angle'
+            ))
     
     with tab4:
+        st.markdown("""
+            <div style="text-align: center;">
+                <h1 style="font-size:30px;">Tunneling Leaderboard</h1>
+            </div>
+        """, unsafe_allow_html=True)
+
+        st.markdown("""
+            <div style="font-size:20px; font-weight:normal; margin-bottom:20px; line-height:1.5; text-align: center;">
+                <em>Every pitcher's pitch types ranked by their tunneling metrics</em>
+            </div>
+        """, unsafe_allow_html=True)
+
+        with span(trace, 'load_tunnel_cube'):
+            cube = load_tunnel_cube()
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            leaderboard_year = st.selectbox(
+                "Game Year", sorted(cube['game_year'].unique().tolist(), reverse=True), key="leaderboard_year"
+            )
+        with col2:
+            leaderboard_stand = st.selectbox("Hitter Stand", ['All', 'L', 'R'], key="leaderboard_stand")
+        with col3:
+            metric = st.selectbox("Metric", list(METRIC_LABELS), format_func=METRIC_LABELS.get, key="leaderboard_metric")
+        with col4:
+            min_pitches = st.number_input(
+                "Minimum Pitches", min_value=1, value=LEADERBOARD_MIN_PITCHES, step=10, key="leaderboard_min_pitches"
+            )
+
+        leaderboard_pitch_types = st.multiselect(
+            "Pitch Types", sorted(cube['pitch_type'].unique().astype(str).tolist()), key="leaderboard_pitch_types"
+        )
+        lowest_first = st.radio(
+            "Order", ["Highest first", "Lowest first"], horizontal=True, key="leaderboard_order"
+        ) == "Lowest first"
+
+        with span(trace, 'leaderboard'):
+            leaderboard = tunnel_leaderboard(
+                cube, leaderboard_year, leaderboard_stand, metric, min_pitches, leaderboard_pitch_types,
+                ascending=lowest_first, limit=LEADERBOARD_ROWS
+            )
+            st.dataframe(format_leaderboard(leaderboard), hide_index=True)
+
+        st.markdown("""
+            <h3 style="text-align: center;">Platoon Splits (vs. RHH minus vs. LHH)</h3>
+        """, unsafe_allow_html=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            min_side_pitches = st.number_input(
+                "Minimum Pitches per Side", min_value=1, value=PLATOON_MIN_PITCHES, step=10, key="platoon_min_pitches"
+            )
+        with col2:
+            # lowest difference first by default, as in the notebook's platoon table
+            splits_lowest_first = st.radio(
+                "Order", ["Lowest first", "Highest first"], horizontal=True, key="platoon_order"
+            ) == "Lowest first"
+        with span(trace, 'platoon_splits'):
+            splits = platoon_splits(
+                cube, leaderboard_year, metric, min_side_pitches, leaderboard_pitch_types,
+                ascending=splits_lowest_first, limit=LEADERBOARD_ROWS
+            )
+            st.dataframe(format_platoon_splits(splits, metric), hide_index=True)
+
+    with tab5:
         st.markdown(f"""
             <div style="text-align: center;">
                 <h1 style="font-size:30px;">Research & Methodology</h1>
@@ -302,7 +479,7 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
-    with tab5:
+    with tab6:
         st.markdown(f"""
             <div style="text-align: center;">
                 <h1 style="font-size:30px;">About Me</h1>
@@ -336,5 +513,20 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
+def main():
+    # timing spans are no-ops unless enabled with TUNNEL_INSTRUMENT, or ?instrument=1 (or =panel) where
+    # TUNNEL_INSTRUMENT_QUERY_PARAMS allows it; ?profile=cprofile|pyinstrument profiles the next rerun only
+    trace = start_rerun(*rerun_settings(st.query_params))
+    context = {}
+    try:
+        render_page(trace, context)
+    finally:
+        # also runs when the page raises or calls st.stop(), so no profiler or tracing is left running
+        record = finish_rerun(trace, TIMINGS_LOG_PATH, **context)
+        if PROFILE_PARAM in st.query_params:
+            del st.query_params[PROFILE_PARAM]
+    if record is not None and trace['mode'] == 'panel':
+        show_timing_panel(record)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from scipy.stats import gaussian_kde
+
+from benchmark import synthetic_pitches, synthetic_store_frame
+from kde_curves import build_kde_curves
+from kde_features import KDE_FEATURES
+
+# worst case measured at CURVE_GRID_SIZE on synthetic arsenals is ~0.6% of the peak density
+MAX_PEAK_ERROR = 0.01
+
+
+@pytest.fixture(scope='module')
+def store_frame():
+    return synthetic_store_frame(synthetic_pitches(0.003, seed=4))
+
+
+def test_curves_match_gaussian_kde(store_frame):
+    curve_keys, grids, curves = build_kde_curves(store_frame)
+    assert len(curve_keys) == len(curves)
+
+    for i, (player_name, game_year, stand, pitch_type) in enumerate(curve_keys.itertuples(index=False)):
+        group = store_frame[(store_frame['player_name'] == player_name) & (store_frame['game_year'] == game_year)]
+        if stand != 'All':
+            group = group[group['stand'] == stand]
+        is_pitch = group['pitch_type'] == pitch_type
+        for j, feature in enumerate(KDE_FEATURES):
+            for k, sample in enumerate([group.loc[is_pitch, feature], group.loc[~is_pitch, feature]]):
+                if len(sample) < 2:
+                    assert np.isnan(curves[i, j, k]).all()
+                    continue
+                expected = gaussian_kde(sample.to_numpy(dtype=float))(grids[j])
+                assert np.abs(curves[i, j, k] - expected).max() <= MAX_PEAK_ERROR * expected.max()
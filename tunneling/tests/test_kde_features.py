@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import gaussian_kde
+
+from benchmark import synthetic_pitches
+from kde_features import KDE_FEATURES, compute_kde_features
+from tunnel_pipeline import prepare_pitches
+
+
+def notebook_kde_features(df, features=KDE_FEATURES):
+    # the notebook's original per-row loop over leave-one-pitch-type-out gaussian_kde fits
+    df = df.copy()
+    for feature in features:
+        df[f'{feature}_KDE'] = float('nan')
+
+    for _, group in df.groupby(['game_year', 'pitcher', 'stand']):
+        kdes = {feature: {} for feature in features}
+        for feature in features:
+            for pitch_type in group['pitch_type'].unique():
+                subset = group[group['pitch_type'] != pitch_type]
+                kdes[feature][pitch_type] = gaussian_kde(subset[feature]) if len(subset) >= 5 else None
+
+        for idx, row in group.iterrows():
+            for feature in features:
+                kde = kdes[feature].get(row['pitch_type'])
+                if kde is not None:
+                    df.loc[idx, f'{feature}_KDE'] = kde(row[feature])[0]
+
+    return df[[f'{feature}_KDE' for feature in features]]
+
+
+@pytest.fixture(scope='module')
+def pitches():
+    df = prepare_pitches(synthetic_pitches(0.002, seed=3)).reset_index(drop=True)
+    # a group too small for any leave-one-out fit stays NaN
+    small = df.head(4).assign(pitcher=1, game_year=df['game_year'].iloc[0])
+    return pd.concat([df, small], ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def expected(pitches):
+    return notebook_kde_features(pitches)
+
+
+def test_kde_features_match_notebook_loop(pitches, expected):
+    actual = compute_kde_features(pitches, n_jobs=1)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-10, atol=1e-12)
+    assert actual.tail(4).isna().all(axis=None)
+
+
+def test_parallel_matches_serial(pitches):
+    pd.testing.assert_frame_equal(compute_kde_features(pitches, n_jobs=2), compute_kde_features(pitches, n_jobs=1))
+
+
+def test_binned_kde_is_close_to_exact(pitches, expected):
+    actual = compute_kde_features(pitches, n_jobs=1, binned_threshold=1)
+    error = (actual - expected).abs().max() / expected.max()
+    assert (error < 1e-3).all()
@@ -0,0 +1,58 @@
+from math import atan2, degrees
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_pitches
+from pitch_angles import add_angle_columns
+
+
+# the notebook's original row-wise angle formulas
+def calculate_VRA(vy0, ay, release_extension, vz0, az):
+    vy_s = -np.sqrt(vy0**2 - 2 * ay * (60.5 - release_extension - 50))
+    t_s = (vy_s - vy0) / ay
+    vz_s = vz0 - az * t_s
+    return -np.arctan(vz_s / vy_s) * (180 / np.pi)
+
+
+def calculate_HRA(vy0, ay, release_extension, vx0, ax):
+    vy_s = -np.sqrt(vy0**2 - 2 * ay * (60.5 - release_extension - 50))
+    t_s = (vy_s - vy0) / ay
+    vx_s = vx0 - ax * t_s
+    return -np.arctan(vx_s / vy_s) * (180 / np.pi)
+
+
+def calculate_approach_angles(row):
+    yf = 17/12
+    vy_f = -np.sqrt(row['vy0']**2 - (2 * row['ay'] * (50 - yf)))
+    t = (vy_f - row['vy0']) / row['ay']
+    vz_f = row['vz0'] + (row['az'] * t)
+    vaa_deg = (180 + degrees(atan2(vz_f, vy_f))) * -1
+    vx_f = row['vx0'] + (row['ax'] * t)
+    haa_deg = -np.arctan(vx_f / vy_f) * (180 / np.pi)
+    return pd.Series([vaa_deg, haa_deg, t, vy_f])
+
+
+@pytest.fixture(scope='module')
+def pitches():
+    return synthetic_pitches(0.002, seed=2).head(500)
+
+
+def test_angles_match_notebook_formulas(pitches):
+    expected = pitches.copy()
+    expected['VRA'] = expected.apply(
+        lambda x: calculate_VRA(x['vy0'], x['ay'], x['release_extension'], x['vz0'], x['az']), axis=1)
+    expected['HRA'] = expected.apply(
+        lambda x: calculate_HRA(x['vy0'], x['ay'], x['release_extension'], x['vx0'], x['ax']), axis=1)
+    expected[['VAA', 'HAA', 't', 'vy_f']] = expected.apply(calculate_approach_angles, axis=1)
+
+    actual = add_angle_columns(pitches)
+    for column in ['VRA', 'HRA', 'VAA', 'HAA', 't', 'vy_f']:
+        np.testing.assert_allclose(actual[column], expected[column], rtol=1e-12, atol=1e-12)
+
+
+def test_unreachable_pitches_give_nan(pitches):
+    # vy0**2 - 2 * ay * distance < 0: the notebook's np.sqrt gives NaN, and so must the vectorized kernel
+    actual = add_angle_columns(pitches.head(1).assign(vy0=-1.0, ay=30.0))
+    assert actual[['VRA', 'HRA', 'VAA', 'HAA']].isna().all(axis=None)
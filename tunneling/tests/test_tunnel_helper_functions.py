@@ -0,0 +1,94 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib.colors import LinearSegmentedColormap, Normalize
+
+from benchmark import synthetic_pitches, synthetic_store_frame
+from tunnel_helper_functions import create_tunneling_table
+
+
+def styler_tunneling_table(data):
+    # the original Styler-based create_tunneling_table
+    data = data.copy()
+    data['Usage%'] = data.groupby('pitch_type')['pitch_type'].transform('count') / len(data) * 100
+
+    grouped_metrics = data.groupby('pitch_type')[['Usage%', 'tunnel_boost', 'x_tunnel', 'y_tunnel',
+                                                'z_tunnel', 'shape_tunnel']].mean().reset_index()
+    grouped_metrics = grouped_metrics.sort_values(by='Usage%', ascending=False)
+    grouped_metrics = grouped_metrics.rename(columns={
+        'pitch_type': 'Pitch Type', 'tunnel_boost': 'Tunnel Boost', 'x_tunnel': 'X Tunnel',
+        'y_tunnel': 'Y Tunnel', 'z_tunnel': 'Z Tunnel', 'shape_tunnel': 'Shape Tunnel'
+    })
+    grouped_metrics = grouped_metrics.round({'Tunnel Boost': 2, 'X Tunnel': 2, 'Y Tunnel': 2,
+                                            'Z Tunnel': 2, 'Shape Tunnel': 2, 'Usage%': 1})
+
+    cmap = LinearSegmentedColormap.from_list("custom_gradient", ["blue", "white", "red"])
+
+    def apply_gradient(s, vmin, vmax):
+        norm = Normalize(vmin=vmin, vmax=vmax)
+        colors = [cmap(norm(val)) for val in s]
+        return [f"background-color: rgba({int(c[0]*255)}, {int(c[1]*255)}, {int(c[2]*255)}, 1)" for c in colors]
+
+    return grouped_metrics.style.apply(
+        lambda s: apply_gradient(s, vmin=-1.5, vmax=1.5), subset=['Tunnel Boost', 'Y Tunnel']
+    ).apply(
+        lambda s: apply_gradient(s, vmin=-0.5, vmax=0.5), subset=['X Tunnel', 'Z Tunnel', 'Shape Tunnel']
+    ).format(
+        {"Tunnel Boost": "{:.2f}", "X Tunnel": "{:.2f}", "Y Tunnel": "{:.2f}",
+         "Z Tunnel": "{:.2f}", "Shape Tunnel": "{:.2f}", "Usage%": "{:.1f}"}
+    ).set_table_styles([
+        {"selector": "thead th", "props": [("font-size", "20px"), ("text-align", "center"), ("color", "black")]},
+        {"selector": "tbody td", "props": [("font-size", "18px"), ("text-align", "center"), ("color", "black")]}
+    ]).hide(axis="index").to_html()
+
+
+def styler_cells(html):
+    # [(text, background or None)] per row, from the Styler's ids and CSS rules
+    backgrounds = {}
+    for selectors, color in re.findall(r'((?:#T_\w+_row\d+_col\d+(?:, )?)+) \{\s*background-color: ([^;]+);', html):
+        for row, col in re.findall(r'_row(\d+)_col(\d+)', selectors):
+            backgrounds[int(row), int(col)] = color
+    rows = {}
+    for row, col, text in re.findall(r'<td id="T_\w+_row(\d+)_col(\d+)" [^>]*>([^<]*)</td>', html):
+        rows.setdefault(int(row), []).append((text, backgrounds.get((int(row), int(col)))))
+    headers = re.findall(r'<th [^>]*class="col_heading[^"]*" >([^<]*)</th>', html)
+    return headers, [rows[row] for row in sorted(rows)]
+
+
+def rendered_cells(html):
+    headers = re.findall(r'<th [^>]*>([^<]*)</th>', html)
+    rows = [
+        [(text, color or None) for color, text in re.findall(r'<td style="[^"]*?(?:background-color: ([^;]+);)?">([^<]*)</td>', row)]
+        for row in re.findall(r'<tr>(.*?)</tr>', html.split('<tbody>')[1])
+    ]
+    return headers, rows
+
+
+@pytest.fixture(scope='module')
+def store_frame():
+    df = synthetic_store_frame(synthetic_pitches(0.005, seed=5))
+    # spread the metrics over and beyond the colour ranges
+    df[['tunnel_boost', 'y_tunnel']] *= 120
+    df[['x_tunnel', 'z_tunnel', 'shape_tunnel']] *= 40
+    return df
+
+
+def test_table_matches_styler_output(store_frame):
+    for _, season_df in store_frame.groupby('pitcher'):
+        season_df = season_df[['pitch_type', 'stand', 'tunnel_boost', 'x_tunnel', 'y_tunnel', 'z_tunnel', 'shape_tunnel']]
+        assert rendered_cells(create_tunneling_table(season_df)) == styler_cells(styler_tunneling_table(season_df))
+
+
+def test_missing_and_clipped_values_match_styler_output():
+    season_df = pd.DataFrame({
+        'pitch_type': ['FF'] * 5 + ['SL'] * 3 + ['CH'] * 2,
+        'stand': ['L', 'R'] * 5,
+        'tunnel_boost': [9.0] * 5 + [-9.0] * 3 + [np.nan] * 2,
+        'x_tunnel': [0.5] * 5 + [-0.5] * 3 + [0.0] * 2,
+        'y_tunnel': [1.499] * 5 + [-1.5] * 3 + [0.004] * 2,
+        'z_tunnel': [np.nan] * 5 + [0.25] * 3 + [-0.25] * 2,
+        'shape_tunnel': [0.1] * 10,
+    })
+    assert rendered_cells(create_tunneling_table(season_df)) == styler_cells(styler_tunneling_table(season_df))
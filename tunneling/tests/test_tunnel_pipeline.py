@@ -0,0 +1,35 @@
+import pytest
+
+from benchmark import synthetic_booster, synthetic_model_frame, synthetic_pitches
+from tunnel_pipeline import full_refresh, incremental_refresh, read_run_values, read_state_years
+
+
+@pytest.fixture(scope='module')
+def pitches():
+    return synthetic_pitches(0.002, seed=1)
+
+
+@pytest.fixture(scope='module')
+def booster(pitches):
+    return synthetic_booster(synthetic_model_frame(pitches), num_boost_round=10)
+
+
+def assert_run_values_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert actual[key].keys() == expected[key].keys()
+        for value, (total, count) in expected[key].items():
+            assert actual[key][value][0] == pytest.approx(total)
+            assert actual[key][value][1] == count
+
+
+def test_reapplied_day_is_counted_once(tmp_path, pitches, booster):
+    day = pitches['game_pk'].isin(pitches['game_pk'].drop_duplicates().iloc[-3:])
+    full_refresh(tmp_path / 'full', pitches, booster, n_jobs=1)
+
+    full_refresh(tmp_path / 'incremental', pitches[~day], booster, n_jobs=1)
+    for _ in range(2):
+        incremental_refresh(tmp_path / 'incremental', pitches[day], booster, n_jobs=1)
+
+    assert_run_values_equal(read_run_values(tmp_path / 'incremental'), read_run_values(tmp_path / 'full'))
+    assert len(read_state_years(tmp_path / 'incremental')) == len(read_state_years(tmp_path / 'full'))
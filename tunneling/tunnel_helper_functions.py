@@ -1,5 +1,8 @@
-from matplotlib.colors import LinearSegmentedColormap, Normalize
-from matplotlib.patches import Ellipse
+import numpy as np
+import pandas as pd
+from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.collections import EllipseCollection
+from matplotlib.lines import Line2D
 
 pitch_color_mapping = {
     'FF': 'red', 'SL': 'orange', 'SI': 'pink', 'CH': 'purple', 'FC': 'blue',
@@ -7,13 +10,88 @@ pitch_color_mapping = {
     'SV': 'yellow', 'FO': 'yellow', 'KN': 'yellow', 'SC': 'yellow'
 }
 
+ELLIPSE_METRIC_PAIRS = [('HRA', 'VRA'), ('HAA', 'VAA')]
+MIN_ELLIPSE_USAGE = 0.02
+
+TUNNEL_METRICS = ['tunnel_boost', 'x_tunnel', 'y_tunnel', 'z_tunnel', 'shape_tunnel']
+
+TABLE_HEADER_STYLE = "font-size: 20px; text-align: center; color: black;"
+TABLE_CELL_STYLE = "font-size: 18px; text-align: center; color: black;"
+
+TABLE_FORMATS = {
+    'Usage%': "{:.1f}", 'Tunnel Boost': "{:.2f}", 'X Tunnel': "{:.2f}", 'Y Tunnel': "{:.2f}",
+    'Z Tunnel': "{:.2f}", 'Shape Tunnel': "{:.2f}"
+}
+
+TABLE_GRADIENT_RANGES = {
+    'Tunnel Boost': (-1.5, 1.5), 'Y Tunnel': (-1.5, 1.5),
+    'X Tunnel': (-0.5, 0.5), 'Z Tunnel': (-0.5, 0.5), 'Shape Tunnel': (-0.5, 0.5)
+}
+
+gradient_cmap = LinearSegmentedColormap.from_list("custom_gradient", ["blue", "white", "red"])
+
+# rgba strings for every colormap entry, with the bad (NaN) color appended last
+gradient_lut = np.array([
+    f"rgba({int(c[0]*255)}, {int(c[1]*255)}, {int(c[2]*255)}, 1)"
+    for c in list(gradient_cmap(np.arange(gradient_cmap.N))) + [gradient_cmap.get_bad()]
+])
+
+
+def gradient_colors(values, vmin, vmax):
+    # same bucketing as cmap(Normalize(vmin, vmax)(values)), including clipping out-of-range values
+    scaled = (values - vmin) / (vmax - vmin) * gradient_cmap.N
+    indices = np.clip(np.floor(np.nan_to_num(scaled, nan=0.0)), 0, gradient_cmap.N - 1).astype(int)
+    indices[np.isnan(values)] = gradient_cmap.N
+    return gradient_lut[indices]
+
+
+TUNNEL_SUM_COLUMNS = ['n'] + [f'{metric}_{stat}' for metric in TUNNEL_METRICS for stat in ('sum', 'count')]
+
+
+def aggregate_tunneling(data, keys=('pitcher', 'game_year')):
+    # pitch counts and metric sums/counts per (keys, stand, pitch_type), with 'All' rows summed over every stand;
+    # total_n is the pitch count of the whole (keys, stand) arsenal, including pitches without a pitch type
+    keys = list(keys)
+
+    aggregations = {'n': ('pitch_type', 'size')}
+    for metric in TUNNEL_METRICS:
+        aggregations[f'{metric}_sum'] = (metric, 'sum')
+        aggregations[f'{metric}_count'] = (metric, 'count')
+
+    by_stand = data.groupby(keys + ['stand', 'pitch_type'], dropna=False, observed=True).agg(**aggregations).reset_index()
+
+    all_stands = by_stand.groupby(keys + ['pitch_type'], dropna=False, observed=True)[TUNNEL_SUM_COLUMNS].sum().reset_index()
+    all_stands['stand'] = 'All'
+
+    totals = pd.concat([by_stand[by_stand['stand'].isin(['L', 'R'])], all_stands], ignore_index=True)
+    totals['stand'] = totals['stand'].astype(str)
+    totals['total_n'] = totals.groupby(keys + ['stand'], dropna=False, observed=True)['n'].transform('sum')
+
+    return totals.dropna(subset=['pitch_type'])
+
+
+def summarize_tunneling(data, keys=('pitcher', 'game_year')):
+    keys = list(keys)
+    group_keys = keys + ['stand', 'pitch_type']
+
+    summary = aggregate_tunneling(data, keys)
+    summary['Usage%'] = summary['n'] / summary['total_n'] * 100
+
+    for metric in TUNNEL_METRICS:
+        summary[metric] = summary[f'{metric}_sum'] / summary[f'{metric}_count']
+
+    summary = summary.sort_values(by=keys + ['stand', 'Usage%'], ascending=[True] * (len(keys) + 1) + [False], kind='stable')
+
+    return summary[group_keys + ['n', 'Usage%'] + TUNNEL_METRICS].reset_index(drop=True)
+
+
 def create_tunneling_table(data):
-    data['Usage%'] = data.groupby('pitch_type')['pitch_type'].transform('count') / len(data) * 100
+    summary = summarize_tunneling(data, keys=[])
+    return render_tunneling_table(summary[summary['stand'] == 'All'])
 
-    grouped_metrics = data.groupby('pitch_type')[['Usage%', 'tunnel_boost', 'x_tunnel', 'y_tunnel',
-                                                'z_tunnel', 'shape_tunnel']].mean().reset_index()
 
-    grouped_metrics = grouped_metrics.sort_values(by='Usage%', ascending=False)
+def render_tunneling_table(summary):
+    grouped_metrics = summary[['pitch_type', 'Usage%'] + TUNNEL_METRICS].reset_index(drop=True)
 
     grouped_metrics = grouped_metrics.rename(columns={
         'pitch_type': 'Pitch Type',
@@ -27,65 +105,85 @@ def create_tunneling_table(data):
     grouped_metrics = grouped_metrics.round({'Tunnel Boost': 2, 'X Tunnel': 2, 'Y Tunnel': 2, 
                                             'Z Tunnel': 2, 'Shape Tunnel': 2, 'Usage%': 1})
 
-    cmap = LinearSegmentedColormap.from_list("custom_gradient", ["blue", "white", "red"])
-
-    def apply_gradient(s, vmin, vmax):
-        norm = Normalize(vmin=vmin, vmax=vmax)  
-        colors = [cmap(norm(val)) for val in s] 
-        return [f"background-color: rgba({int(c[0]*255)}, {int(c[1]*255)}, {int(c[2]*255)}, 1)" for c in colors]
-
-    styled_metrics = grouped_metrics.style.apply(
-        lambda s: apply_gradient(s, vmin=-1.5, vmax=1.5), subset=['Tunnel Boost', 'Y Tunnel']
-    ).apply(
-        lambda s: apply_gradient(s, vmin=-0.5, vmax=0.5), subset=['X Tunnel', 'Z Tunnel', 'Shape Tunnel']
-    ).format(
-        {"Tunnel Boost": "{:.2f}", "X Tunnel": "{:.2f}", "Y Tunnel": "{:.2f}", 
-        "Z Tunnel": "{:.2f}", "Shape Tunnel": "{:.2f}", "Usage%": "{:.1f}"}
-    ).set_table_styles([
-        {"selector": "thead th", "props": [("font-size", "20px"), ("text-align", "center"), ("color", "black")]},
-        {"selector": "tbody td", "props": [("font-size", "18px"), ("text-align", "center"), ("color", "black")]}
-    ]).hide(axis="index")
-
-    html_output = styled_metrics.to_html()
-    return html_output
+    header_cells = ''.join(f'<th style="{TABLE_HEADER_STYLE}">{column}</th>' for column in grouped_metrics.columns)
+
+    body_columns = []
+    for column in grouped_metrics.columns:
+        values = grouped_metrics[column]
+        if column == 'Pitch Type':
+            cells = values.astype(str)
+        else:
+            cells = values.map(TABLE_FORMATS[column].format)
+
+        if column in TABLE_GRADIENT_RANGES:
+            vmin, vmax = TABLE_GRADIENT_RANGES[column]
+            backgrounds = gradient_colors(values.to_numpy(dtype=float), vmin, vmax)
+            body_columns.append([f'<td style="{TABLE_CELL_STYLE} background-color: {background};">{cell}</td>'
+                                 for cell, background in zip(cells, backgrounds)])
+        else:
+            body_columns.append([f'<td style="{TABLE_CELL_STYLE}">{cell}</td>' for cell in cells])
+
+    body_rows = ''.join(f'<tr>{"".join(row)}</tr>' for row in zip(*body_columns))
+
+    return f'<table><thead><tr>{header_cells}</tr></thead><tbody>{body_rows}</tbody></table>'
+
+
+def summarize_pitcher_metrics(player_df, metric_pairs=ELLIPSE_METRIC_PAIRS):
+    # every metric pair and both stands from one groupby; rows missing either metric of a pair are masked out of that pair only
+    columns = {'stand': player_df['stand'], 'pitch_type': player_df['pitch_type']}
+    aggregations = {}
+    for i, (x_metric, y_metric) in enumerate(metric_pairs):
+        valid = player_df[x_metric].notna() & player_df[y_metric].notna()
+        columns[f'n_{i}'] = valid.astype(int)
+        columns[f'x_{i}'] = player_df[x_metric].where(valid)
+        columns[f'y_{i}'] = player_df[y_metric].where(valid)
+        aggregations.update({
+            f'n_{i}': (f'n_{i}', 'sum'),
+            f'mean_x_{i}': (f'x_{i}', 'mean'), f'mean_y_{i}': (f'y_{i}', 'mean'),
+            f'std_x_{i}': (f'x_{i}', 'std'), f'std_y_{i}': (f'y_{i}', 'std')
+        })
+
+    grouped = pd.DataFrame(columns).groupby(['stand', 'pitch_type'], observed=True).agg(**aggregations).reset_index()
+
+    summaries = []
+    for i, (x_metric, y_metric) in enumerate(metric_pairs):
+        pair = grouped[['stand', 'pitch_type', f'n_{i}', f'mean_x_{i}', f'mean_y_{i}', f'std_x_{i}', f'std_y_{i}']]
+        pair.columns = ['stand', 'pitch_type', 'n', 'mean_x', 'mean_y', 'std_x', 'std_y']
+        pair = pair[pair['n'] > 0].assign(x_metric=x_metric, y_metric=y_metric)
+        pair['usage'] = pair['n'] / pair.groupby('stand', observed=True)['n'].transform('sum')
+        summaries.append(pair)
+
+    summary = pd.concat(summaries, ignore_index=True)
+    return summary.sort_values(['x_metric', 'y_metric', 'stand', 'usage'], ascending=[True, True, True, False], kind='stable')
+
+
+def plot_pitcher_metrics(player_name, player_df, fig, axs, x_metric, y_metric, x_label, y_label, summary=None):
+    if summary is None:
+        summary = summarize_pitcher_metrics(player_df, [(x_metric, y_metric)])
+    summary = summary[(summary['x_metric'] == x_metric) & (summary['y_metric'] == y_metric)]
 
-
-def plot_pitcher_metrics(player_name, player_df, fig, axs, x_metric, y_metric, x_label, y_label):
     for stand, ax in zip(['L', 'R'], axs):
-        stand_df = player_df[player_df['stand'] == stand]
-
-        stand_df = stand_df.dropna(subset=[x_metric, y_metric])
-
-        pitch_type_counts = stand_df['pitch_type'].value_counts(normalize=True)
-
-        valid_pitch_types = pitch_type_counts[pitch_type_counts >= 0.02].index
+        grouped = summary[(summary['stand'] == stand) & (summary['usage'] >= MIN_ELLIPSE_USAGE)]
+        grouped = grouped[grouped['pitch_type'].map(pitch_color_mapping).notna()]
+        colors = grouped['pitch_type'].map(pitch_color_mapping).tolist()
 
-        filtered_df = stand_df[stand_df['pitch_type'].isin(valid_pitch_types)]
+        centers = grouped[['mean_x', 'mean_y']].to_numpy()
+        spreads = grouped[['std_x', 'std_y']].to_numpy()
+        has_spread = ~np.isnan(spreads).any(axis=1)
 
-        grouped = filtered_df.groupby('pitch_type').agg(
-            mean_x=(x_metric, 'mean'),
-            mean_y=(y_metric, 'mean'),
-            std_x=(x_metric, 'std'),
-            std_y=(y_metric, 'std')
-        ).reset_index()
+        ax.add_collection(EllipseCollection(
+            2 * spreads[has_spread, 0], 2 * spreads[has_spread, 1], np.zeros(has_spread.sum()), units='xy',
+            offsets=centers[has_spread], offset_transform=ax.transData,
+            edgecolors=[c for c, keep in zip(colors, has_spread) if keep], facecolors='none', linewidths=2, linestyles='--'
+        ), autolim=False)
+        ax.update_datalim(np.vstack([centers[has_spread] - spreads[has_spread], centers[has_spread] + spreads[has_spread]]))
 
-        for _, row in grouped.iterrows():
-            pitch_color = pitch_color_mapping.get(row['pitch_type'])
-            if pitch_color:  
-                ax.scatter(row['mean_x'], row['mean_y'], 
-                        edgecolor=pitch_color, facecolor='white', lw=2, s=100, label=row['pitch_type'])
-                
-                ellipse = Ellipse((row['mean_x'], row['mean_y']),
-                                width=2 * row['std_x'], height=2 * row['std_y'],
-                                edgecolor=pitch_color, facecolor='none', lw=2, linestyle='--')
-                ax.add_patch(ellipse)
+        ax.scatter(centers[:, 0], centers[:, 1], edgecolor=colors, facecolor='white', lw=2, s=100)
 
-        handles, labels = ax.get_legend_handles_labels()
-        sorted_handles_labels = sorted(
-            zip(handles, labels), key=lambda x: pitch_type_counts.get(x[1], 0), reverse=True
-        )
-        sorted_handles, sorted_labels = zip(*sorted_handles_labels) if sorted_handles_labels else ([], [])
-        ax.legend(sorted_handles, sorted_labels, title='Pitch Type', loc='upper right', fontsize=14, title_fontsize=16)
+        # grouped is already ordered by usage, so the legend is too
+        handles = [Line2D([], [], linestyle='', marker='o', markersize=10, markeredgewidth=2,
+                          markeredgecolor=color, markerfacecolor='white') for color in colors]
+        ax.legend(handles, grouped['pitch_type'].tolist(), title='Pitch Type', loc='upper right', fontsize=14, title_fontsize=16)
 
         ax.set_title(f"vs. {stand}HH", fontsize=20)
         ax.set_xlabel(x_label, fontsize=16)
@@ -95,4 +193,4 @@ def plot_pitcher_metrics(player_name, player_df, fig, axs, x_metric, y_metric, x
         x_min, x_max = ax.get_xlim()
         y_min, y_max = ax.get_ylim()
         ax.set_xticks(range(int(x_min), int(x_max) + 1))
-        ax.set_yticks(range(int(y_min), int(y_max) + 1))
\ No newline at end of file
+        ax.set_yticks(range(int(y_min), int(y_max) + 1))
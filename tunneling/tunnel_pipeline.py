@@ -0,0 +1,252 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from kde_features import KDE_FEATURES, compute_kde_features
+from pitch_angles import add_angle_columns
+from tunnel_store import write_store
+
+GROUP_KEYS = ['pitcher', 'game_year', 'stand']
+PITCH_KEYS = ['game_pk', 'at_bat_number', 'pitch_number']
+
+PITCH_COLUMNS = PITCH_KEYS + [
+    'game_date', 'game_year', 'pitcher', 'player_name', 'stand', 'p_throws', 'pitch_type',
+    'release_speed', 'release_pos_x', 'release_pos_z', 'release_extension', 'release_spin_rate', 'spin_axis',
+    'vx0', 'vy0', 'vz0', 'ax', 'ay', 'az', 'plate_x', 'plate_z',
+    'balls', 'strikes', 'description', 'events', 'delta_run_exp'
+]
+
+FASTBALLS = ['FF', 'SI', 'FC', 'FA']
+
+MODEL_FEATURES = [
+    'release_speed', 'release_pos_x', 'release_pos_z', 'platoon_state', 'count', 'game_year', 'pitch_group',
+    'ax', 'az', 'plate_x', 'plate_z', 'release_extension', 'release_spin_rate', 'spin_axis', 'avg_release_pos_x',
+    'avg_release_pos_z', 'HRA_KDE', 'VRA_KDE', 'VAA_KDE', 'HAA_KDE', 'avg_t'
+]
+TARGET = 'run_value'
+
+TUNNEL_COLUMNS = ['predicted_run_value', 'tunnel_boost', 'x_tunnel', 'y_tunnel', 'z_tunnel', 'shape_tunnel', 'arm_angle_tunnel']
+SCORE_CHUNK_SIZE = 100_000
+
+# (balls, strikes) -> 0..11 in the same order as the notebook's count_mapping
+COUNT_MAPPING = {(balls, strikes): balls * 3 + strikes for balls in range(4) for strikes in range(3)}
+
+PITCHES_DIR = 'pitches'
+RUN_VALUES_FILE = 'run_values.json'
+
+
+def prepare_pitches(pitches):
+    pitches = add_angle_columns(pitches[PITCH_COLUMNS])
+    return pitches.dropna(subset=KDE_FEATURES + ['pitch_type', 'game_year', 'pitcher', 'stand'])
+
+
+def fastball_baselines(df):
+    average_pos = df.groupby(GROUP_KEYS)[['release_pos_x', 'release_pos_z']].mean().add_prefix('avg_')
+
+    df_fb = df[df['pitch_type'].isin(FASTBALLS)]
+
+    # mode per group, ties broken alphabetically like Series.mode().iloc[0]
+    fb_counts = df_fb.groupby(GROUP_KEYS + ['pitch_type']).size().reset_index(name='n')
+    most_common_fb = fb_counts.sort_values(
+        GROUP_KEYS + ['n', 'pitch_type'], ascending=[True] * len(GROUP_KEYS) + [False, True]
+    ).drop_duplicates(GROUP_KEYS)[GROUP_KEYS + ['pitch_type']].rename(columns={'pitch_type': 'most_common_fb'})
+
+    df_fb = df_fb.merge(most_common_fb, on=GROUP_KEYS)
+    average_t = df_fb[df_fb['pitch_type'] == df_fb['most_common_fb']].groupby(GROUP_KEYS + ['most_common_fb'])['t'].mean()
+    average_t = average_t.rename('avg_t').reset_index().set_index(GROUP_KEYS)
+
+    return average_pos.join(average_t, how='left').reset_index()
+
+
+def pitch_groups(df):
+    # 0 if fastball, 1 if breaker, 2 if offspeed
+    cutter_is_fb = df['most_common_fb'] == 'FC'
+    conditions = [
+        df['pitch_type'].isin(['FF', 'SI', 'FA']) | ((df['pitch_type'] == 'FC') & cutter_is_fb),
+        df['pitch_type'].isin(['SL', 'CU', 'KC', 'ST', 'SV']) | ((df['pitch_type'] == 'FC') & ~cutter_is_fb),
+        df['pitch_type'].isin(['CH', 'FS', 'KN', 'EP', 'FO', 'SC'])
+    ]
+    return pd.Series(np.select(conditions, [0, 1, 2], default=np.nan), index=df.index)
+
+
+def update_run_values(run_values, pitches, sign=1):
+    # sign=-1 takes pitches back out, e.g. stored rows that a re-applied day replaces
+    for key, rows in [('description', pitches), ('events', pitches[pitches['description'] == 'hit_into_play'])]:
+        totals = rows.groupby(key)['delta_run_exp'].agg(['sum', 'count'])
+        state = run_values.setdefault(key, {})
+        for value, (total, count) in totals.iterrows():
+            previous_total, previous_count = state.get(value, (0.0, 0))
+            state[value] = (previous_total + sign * total, previous_count + sign * int(count))
+    return run_values
+
+
+def run_value_means(run_values, key):
+    return pd.Series({value: total / count if count else np.nan for value, (total, count) in run_values.get(key, {}).items()},
+                     dtype=float)
+
+
+def build_model_frame(df, run_values):
+    model_df = df.merge(fastball_baselines(df), on=GROUP_KEYS, how='left')
+    model_df.index = df.index
+
+    model_df['pitch_group'] = pitch_groups(model_df)
+
+    conditions = [
+        (model_df['stand'] == 'L') & (model_df['p_throws'] == 'L'),
+        (model_df['stand'] == 'L') & (model_df['p_throws'] == 'R'),
+        (model_df['stand'] == 'R') & (model_df['p_throws'] == 'L'),
+        (model_df['stand'] == 'R') & (model_df['p_throws'] == 'R')
+    ]
+    model_df['platoon_state'] = np.select(conditions, [0, 1, 2, 3])
+    model_df['count'] = pd.Series(list(zip(model_df['balls'], model_df['strikes'])), index=model_df.index).map(COUNT_MAPPING)
+
+    description_avg = model_df['description'].map(run_value_means(run_values, 'description'))
+    events_avg = model_df['events'].map(run_value_means(run_values, 'events'))
+    model_df[TARGET] = np.where(model_df['description'] == 'hit_into_play', events_avg, description_avg)
+
+    return model_df
+
+
+def load_booster(model_path):
+    booster = xgb.Booster(model_file=model_path)
+    # chunks are scored in parallel threads, so each prediction runs single-threaded
+    booster.set_param({'nthread': 1})
+    return booster
+
+
+def _tunnel_contributions(booster, features):
+    # tree SHAP contributions, one column per feature plus the bias term last
+    contribs = booster.predict(xgb.DMatrix(features, nthread=1), pred_contribs=True)
+    shap_values = {col: contribs[:, MODEL_FEATURES.index(col)] for col in MODEL_FEATURES}
+
+    x_tunnel = shap_values['HRA_KDE'] + shap_values['HAA_KDE']
+    z_tunnel = shap_values['VRA_KDE'] + shap_values['VAA_KDE']
+    columns = {
+        'predicted_run_value': contribs.sum(axis=1),
+        'tunnel_boost': x_tunnel + z_tunnel + shap_values['avg_t'],
+        'x_tunnel': x_tunnel,
+        'y_tunnel': shap_values['avg_t'],
+        'z_tunnel': z_tunnel,
+        'shape_tunnel': x_tunnel + z_tunnel,
+        'arm_angle_tunnel': shap_values['avg_release_pos_x'] + shap_values['avg_release_pos_z']
+    }
+    return np.column_stack([columns[col] for col in TUNNEL_COLUMNS])
+
+
+def score_tunnel_boost(booster, model_df, chunk_size=SCORE_CHUNK_SIZE, n_threads=None):
+    scored = model_df.dropna(subset=MODEL_FEATURES)
+    scores = pd.DataFrame(np.nan, index=model_df.index, columns=TUNNEL_COLUMNS)
+    if scored.empty:
+        return scores
+
+    # each chunk predicts on one thread, so smaller inputs are split until every thread has a chunk
+    features = scored[MODEL_FEATURES]
+    n_threads = n_threads or os.cpu_count()
+    chunk_size = max(1, min(chunk_size, ceil(len(features) / n_threads)))
+    chunks = [features.iloc[start:start + chunk_size] for start in range(0, len(features), chunk_size)]
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        results = list(executor.map(lambda chunk: _tunnel_contributions(booster, chunk), chunks))
+
+    scores.loc[scored.index] = np.vstack(results)
+    return scores
+
+
+def enrich_groups(df, run_values, booster, n_jobs=None):
+    kde_values = compute_kde_features(df, n_jobs=n_jobs)
+    model_df = build_model_frame(df.join(kde_values), run_values)
+    return model_df.join(score_tunnel_boost(booster, model_df))
+
+
+def read_run_values(state_path):
+    path = os.path.join(state_path, RUN_VALUES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {key: {value: tuple(totals) for value, totals in state.items()} for key, state in json.load(f).items()}
+
+
+def write_run_values(state_path, run_values):
+    path = os.path.join(state_path, RUN_VALUES_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(run_values, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_state_years(state_path, years=None):
+    pitches_dir = os.path.join(state_path, PITCHES_DIR)
+    if not os.path.isdir(pitches_dir):
+        return pd.DataFrame()
+    stored_years = sorted(int(name.split('.')[0]) for name in os.listdir(pitches_dir) if name.endswith('.parquet'))
+    frames = [pd.read_parquet(os.path.join(pitches_dir, f'{year}.parquet'))
+              for year in stored_years if years is None or year in years]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def write_state_year(state_path, year, df):
+    pitches_dir = os.path.join(state_path, PITCHES_DIR)
+    os.makedirs(pitches_dir, exist_ok=True)
+    path = os.path.join(pitches_dir, f'{year}.parquet')
+    df.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def full_refresh(state_path, pitches, booster, n_jobs=None):
+    df = prepare_pitches(pitches).drop_duplicates(PITCH_KEYS, keep='last').reset_index(drop=True)
+    run_values = update_run_values({}, df)
+    enriched = enrich_groups(df, run_values, booster, n_jobs)
+
+    for year, year_df in enriched.groupby('game_year'):
+        write_state_year(state_path, year, year_df)
+    write_run_values(state_path, run_values)
+    return enriched
+
+
+def incremental_refresh(state_path, new_pitches, booster, n_jobs=None):
+    new_df = prepare_pitches(new_pitches).drop_duplicates(PITCH_KEYS, keep='last')
+    if new_df.empty:
+        return new_df
+
+    dirty_keys = new_df[GROUP_KEYS].drop_duplicates()
+    existing = read_state_years(state_path, set(dirty_keys['game_year']))
+
+    if existing.empty:
+        clean, dirty_existing = existing, existing
+    else:
+        is_dirty = (existing.merge(dirty_keys, on=GROUP_KEYS, how='left', indicator=True)['_merge'] == 'both').to_numpy()
+        clean, dirty_existing = existing[~is_dirty], existing[is_dirty]
+
+    # only the dirty groups are re-enriched; everything derived is recomputed from their raw pitch columns
+    dirty_df = pd.concat([dirty_existing.reindex(columns=new_df.columns), new_df], ignore_index=True)
+    dirty_df = dirty_df.drop_duplicates(PITCH_KEYS, keep='last').reset_index(drop=True)
+
+    # run value averages are league-wide; only the dirty rows pick up the updated means until the next full refresh.
+    # stored pitches that new_df replaces are taken out first, so re-applying a day does not count it twice
+    replaced = dirty_existing.merge(new_df[PITCH_KEYS], on=PITCH_KEYS) if not dirty_existing.empty else dirty_existing
+    run_values = read_run_values(state_path)
+    if not replaced.empty:
+        run_values = update_run_values(run_values, replaced, sign=-1)
+    run_values = update_run_values(run_values, new_df)
+    enriched = enrich_groups(dirty_df, run_values, booster, n_jobs)
+
+    for year, year_df in enriched.groupby('game_year'):
+        year_clean = clean[clean['game_year'] == year] if not clean.empty else clean
+        write_state_year(state_path, year, pd.concat([year_clean, year_df], ignore_index=True))
+    write_run_values(state_path, run_values)
+    return enriched
+
+
+def export_store(state_path, store_path):
+    df = read_state_years(state_path)
+    write_store(df[df['tunnel_boost'].notna()], store_path)
+
+
+if __name__ == '__main__':
+    state_path, new_pitches_path, model_path, store_path = sys.argv[1:5]
+    incremental_refresh(state_path, pd.read_csv(new_pitches_path), load_booster(model_path))
+    export_store(state_path, store_path)
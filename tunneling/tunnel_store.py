@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from kde_curves import CURVE_KEYS, build_kde_curves
+from leaderboard import build_tunnel_cube
+from tunnel_helper_functions import summarize_tunneling
+
+STORE_COLUMNS = [
+    'pitcher', 'player_name', 'game_year', 'pitch_type', 'stand',
+    'VRA', 'HRA', 'VAA', 'HAA',
+    'tunnel_boost', 'x_tunnel', 'y_tunnel', 'z_tunnel', 'shape_tunnel'
+]
+
+STORE_SCHEMA = {
+    'pitcher': 'int32', 'game_year': 'int16',
+    'player_name': 'category', 'pitch_type': 'category', 'stand': 'category', 'p_throws': 'category',
+    'VRA': 'float32', 'HRA': 'float32', 'VAA': 'float32', 'HAA': 'float32',
+    'tunnel_boost': 'float32', 'x_tunnel': 'float32', 'y_tunnel': 'float32', 'z_tunnel': 'float32', 'shape_tunnel': 'float32'
+}
+
+INDEX_FILE = '_index.json'
+SUMMARY_FILE = '_summary.parquet'
+CUBE_FILE = '_cube.parquet'
+KDE_CURVES_FILE = '_kde_curves.npy'
+KDE_GRIDS_FILE = '_kde_grids.npy'
+KDE_CURVE_KEYS_FILE = '_kde_curve_keys.parquet'
+
+
+def apply_schema(data):
+    return data.astype({column: dtype for column, dtype in STORE_SCHEMA.items() if column in data.columns})
+
+
+def memory_report(data):
+    report = pd.DataFrame({
+        'dtype': data.dtypes.astype(str),
+        'MB': data.memory_usage(deep=True, index=False) / 2**20
+    })
+    return report.sort_values('MB', ascending=False)
+
+
+def write_store(data, store_path):
+    data = apply_schema(data[STORE_COLUMNS]).sort_values(['game_year', 'pitcher'], kind='stable')
+
+    tmp_path = store_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    row_groups = {}
+    for year, year_df in data.groupby('game_year', sort=True):
+        year_dir = os.path.join(tmp_path, f'game_year={year}')
+        os.makedirs(year_dir)
+        file_name = os.path.join(f'game_year={year}', 'part-0.parquet')
+
+        year_table = pa.Table.from_pandas(year_df.drop(columns='game_year'), preserve_index=False)
+        pitcher_groups = year_df.groupby('pitcher', sort=True)['player_name'].agg(['size', 'first'])
+
+        # one row group per pitcher so a player/year lookup reads only that pitcher's rows
+        with pq.ParquetWriter(os.path.join(tmp_path, file_name), year_table.schema) as writer:
+            offset = 0
+            for group_id, (size, player_name) in enumerate(pitcher_groups.itertuples(index=False)):
+                writer.write_table(year_table.slice(offset, size))
+                offset += size
+
+                player_years = row_groups.setdefault(player_name, {})
+                player_years.setdefault(str(year), [file_name, []])[1].append(group_id)
+
+    store_index = {
+        'players': sorted(row_groups),
+        'years': {player: sorted((int(year) for year in years), reverse=True) for player, years in row_groups.items()},
+        'row_groups': row_groups
+    }
+    with open(os.path.join(tmp_path, INDEX_FILE), 'w') as f:
+        json.dump(store_index, f)
+
+    summary = summarize_tunneling(data, keys=['player_name', 'game_year'])
+    summary.to_parquet(os.path.join(tmp_path, SUMMARY_FILE), index=False)
+    build_tunnel_cube(data).to_parquet(os.path.join(tmp_path, CUBE_FILE), index=False)
+
+    curve_keys, grids, curves = build_kde_curves(data)
+    curve_keys.to_parquet(os.path.join(tmp_path, KDE_CURVE_KEYS_FILE), index=False)
+    np.save(os.path.join(tmp_path, KDE_GRIDS_FILE), grids)
+    np.save(os.path.join(tmp_path, KDE_CURVES_FILE), curves)
+
+    shutil.rmtree(store_path, ignore_errors=True)
+    os.rename(tmp_path, store_path)
+
+
+def convert_csv_to_store(csv_path, store_path):
+    data = pd.read_csv(csv_path, usecols=STORE_COLUMNS, dtype={column: STORE_SCHEMA[column] for column in STORE_COLUMNS})
+    write_store(data, store_path)
+
+
+def read_store_index(store_path):
+    with open(os.path.join(store_path, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def read_tunneling_summary(store_path):
+    summary = pd.read_parquet(os.path.join(store_path, SUMMARY_FILE))
+    return summary.set_index(['player_name', 'game_year', 'stand']).sort_index()
+
+
+def read_tunnel_cube(store_path):
+    return pd.read_parquet(os.path.join(store_path, CUBE_FILE))
+
+
+def read_kde_curves(store_path):
+    curve_keys = pd.read_parquet(os.path.join(store_path, KDE_CURVE_KEYS_FILE))
+    curve_index = {key: i for i, key in enumerate(curve_keys[CURVE_KEYS + ['stand', 'pitch_type']].itertuples(index=False, name=None))}
+    grids = np.load(os.path.join(store_path, KDE_GRIDS_FILE))
+    curves = np.load(os.path.join(store_path, KDE_CURVES_FILE), mmap_mode='r')
+    return curve_index, grids, curves
+
+
+def read_pitcher_season(store_path, store_index, player_name, game_year, columns=None):
+    file_name, row_groups = store_index['row_groups'][player_name][str(game_year)]
+    parquet_file = pq.ParquetFile(os.path.join(store_path, file_name))
+    data = parquet_file.read_row_groups(row_groups, columns=columns).to_pandas()
+    if columns is None or 'game_year' in columns:
+        data['game_year'] = np.int16(game_year)
+    return data
+
+
+if __name__ == '__main__':
+    convert_csv_to_store(sys.argv[1], sys.argv[2])